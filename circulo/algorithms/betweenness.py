@@ -1,67 +1,498 @@
-import igraph as ig
 import itertools
-from collections import Counter
-
-
-def edge_and_pair_betweenness(G):
-	"""
-	An attempt to find the edge and pair betweennesses without finding all 
-	shortest paths, using flows. Currently unused.
-	"""
-	eb = {edge.tuple : 0 for edge in G.es}
-	pb = {vertex.index : {uw : 0 for uw in itertools.combinations(G.neighbors(vertex), 2)} for vertex in G.vs}
-	for v in G.vs:
-		flows, pairFlows = get_flows(G, v.index, eb, pb)
-		for flow in flows: # pythonify
-			eb[flow] += flows[flow] / 2. # counted twice.
-		for pflow in pairFlows:
-			for uw in pairFlows[pflow]:
-				pb[pflow][uw] += pairFlows[pflow][uw] / 2. 
-	return eb, pb
-
-
-def get_flows(G, index, eb, pb):
-	"""
-	Initializing the edge and pair betweenness dicts using flows.
-	Edge betweenness correct, but pair betweenness needs work. 
-	This can be used as a template for future work concerning flows.
-	"""
-	# don't reinitialize these dicts each time.
-	flows = {edge.tuple : 0 for edge in G.es}
-	pairFlows = {vertex.index : {uw : 0 for uw in itertools.combinations(G.neighbors(vertex), 2)} for vertex in G.vs}
-	bfs = G.bfsiter(index, advanced=True)
-	bfsList = [bfs.next()[0].index]
-	# skipping root, manually adding it
-	bfsDict = {index : {"depth" : 0, "parents" : [], "numPaths": 1, "flow": 1}}
-	nodesSeen = set([index])
-	# initializing bfs dict (decompose)
-	for v, depth, parent in bfs:
-		i = v.index
-		bfsList.append(i) # probably don't need
-		parents = [p for p in G.neighbors(v) if p in nodesSeen and bfsDict[p]["depth"] < depth]
-		nodesSeen.add(i)
-		numPaths = sum(bfsDict[p]["numPaths"] for p in parents)
-		bfsDict[i] = {"depth": depth, "parents": parents, "numPaths": numPaths, "flow": 1}
-
-	# getting flows (decompose)
-	for v in reversed(bfsList):
-		# getting edge flows
-		parents = bfsDict[v]["parents"]
-		totalPaths = float(sum(bfsDict[p]["numPaths"] for p in parents))
-		for p in parents:
-			flowProportion = bfsDict[p]["numPaths"] / totalPaths
-			flow = flowProportion * bfsDict[v]["flow"]
-			flows[order_tuple((v, p))] = flow
-			bfsDict[p]["flow"] += flow
-			grandparents = bfsDict[p]["parents"]
-			totalGrandparentPaths = float(sum(bfsDict[g]["numPaths"] for g in set(grandparents)))
-			for g in grandparents:
-				gCount = Counter(grandparents)
-				gFlowProportion = bfsDict[g]["numPaths"] / totalPaths / float(gCount[g])
-				gFlow = gFlowProportion * bfsDict[v]["flow"]
-				pairFlows[p][order_tuple((v, g))] = gFlow
-
-	##
-	# pairFlows are incorrect!!!
-	##
-	return flows, pairFlows
\ No newline at end of file
+import multiprocessing
+import numpy as np
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+
+# Edge, vertex and pair betweenness of a graph, as returned by
+# edge_and_pair_betweenness. pair holds the pair betweenness of every
+# vertex v in pair[offsets[v]:offsets[v + 1]], one slot per pair of
+# neighbors of v in the order of itertools.combinations(G.neighbors(v), 2).
+Betweenness = namedtuple('Betweenness', 'edge vertex pair offsets')
+
+# The most edges a graph can have for accumulate_sources to run in plain
+# Python rather than by NumPy passes over each BFS level.
+SMALL_GRAPH_EDGES = 300
+
+
+def csr_adjacency(G):
+	"""
+	Given an undirected graph G, returns its adjacency in compressed sparse
+	row form as a 3-tuple (indptr, indices, eids) of NumPy arrays. The
+	neighbors of v are indices[indptr[v]:indptr[v + 1]], in the same order
+	as G.neighbors(v), and eids holds the id of the edge behind each entry.
+	"""
+	n = G.vcount()
+	edges = np.array(G.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+	allEids = np.arange(len(edges), dtype=np.int64)
+	tails = np.concatenate((edges[:, 0], edges[:, 1]))
+	heads = np.concatenate((edges[:, 1], edges[:, 0]))
+	eids = np.concatenate((allEids, allEids))
+
+	# sort by tail, then by head, which is the order igraph lists neighbors in.
+	order = np.lexsort((heads, tails))
+	indptr = np.zeros(n + 1, dtype=np.int64)
+	np.cumsum(np.bincount(tails, minlength=n), out=indptr[1:])
+	return indptr, heads[order], eids[order]
+
+
+def pair_slots(indptr, indices, relevant=None):
+	"""
+	Lays out one slot for every pair of neighbors of every vertex in relevant
+	(all vertices if relevant is None). Returns (offsets, slots) where the
+	slots of v are offsets[v]:offsets[v + 1] and slots is a 3-tuple of arrays
+	(v, u, w) giving the middle vertex and the two neighbors of each slot.
+	"""
+	n = len(indptr) - 1
+	if relevant is None:
+		relevant = range(n)
+	degrees = np.diff(indptr)
+	sizes = np.zeros(n, dtype=np.int64)
+	for v in relevant:
+		sizes[v] = degrees[v] * (degrees[v] - 1) // 2
+	offsets = np.zeros(n + 1, dtype=np.int64)
+	np.cumsum(sizes, out=offsets[1:])
+
+	pairV = np.empty(offsets[-1], dtype=np.int64)
+	pairU = np.empty(offsets[-1], dtype=np.int64)
+	pairW = np.empty(offsets[-1], dtype=np.int64)
+	for v in np.flatnonzero(sizes):
+		neighbors = indices[indptr[v]:indptr[v + 1]]
+		# triu_indices walks the pairs in the same order as itertools.combinations
+		i, j = np.triu_indices(len(neighbors), 1)
+		pairV[offsets[v]:offsets[v + 1]] = v
+		pairU[offsets[v]:offsets[v + 1]] = neighbors[i]
+		pairW[offsets[v]:offsets[v + 1]] = neighbors[j]
+	return offsets, (pairV, pairU, pairW)
+
+
+def expand_ranges(starts, counts):
+	"""
+	Given arrays of range starts and lengths, returns the concatenation of
+	all of the ranges as one array.
+	"""
+	ends = np.cumsum(counts)
+	return np.arange(ends[-1] if len(ends) else 0) + np.repeat(starts - ends + counts, counts)
+
+
+def accumulate_source(source, indptr, indices, eids, eb, vb, pb=None, slots=None, cutoff=None):
+	"""
+	Runs one breadth first search from source followed by one pass of
+	Brandes' dependency accumulation, adding the source's contribution to the
+	edge (eb), vertex (vb) and, when given, pair (pb) betweenness arrays in
+	place. Paths longer than cutoff are ignored when cutoff is given.
+
+	No paths are ever listed: sigma[v] counts the shortest paths from the
+	source to v and delta[v] is the dependency of the source on v. A pair
+	(u, w) at v with u one level above v and w one level below it carries
+	sigma[u] / sigma[w] * (1 + delta[w]) of those paths.
+	"""
+	n = len(indptr) - 1
+	dist = np.full(n, -1, dtype=np.int64)
+	sigma = np.zeros(n)
+	dist[source] = 0
+	sigma[source] = 1
+
+	# forward pass: one level of the shortest path DAG at a time.
+	levels = []
+	frontier = np.array([source], dtype=np.int64)
+	depth = 0
+	while frontier.size and (cutoff is None or depth < cutoff):
+		counts = indptr[frontier + 1] - indptr[frontier]
+		arcs = expand_ranges(indptr[frontier], counts)
+		tails = np.repeat(frontier, counts)
+		heads = indices[arcs]
+		frontier = np.unique(heads[dist[heads] < 0])
+		dist[frontier] = depth + 1
+		onDag = dist[heads] == depth + 1
+		tails, heads, arcs = tails[onDag], heads[onDag], arcs[onDag]
+		np.add.at(sigma, heads, sigma[tails])
+		levels.append((tails, heads, eids[arcs]))
+		depth += 1
+
+	# backward pass: push dependencies up the DAG, deepest level first.
+	delta = np.zeros(n)
+	for tails, heads, arcEids in reversed(levels):
+		flow = sigma[tails] / sigma[heads] * (1 + delta[heads])
+		np.add.at(delta, tails, flow)
+		np.add.at(eb, arcEids, flow)
+	delta[source] = 0
+	vb += delta
+
+	if pb is not None and len(pb):
+		accumulate_pairs(dist, sigma, delta, pb, slots)
+
+
+def accumulate_pairs(dist, sigma, delta, pb, slots):
+	"""
+	Adds one source's contribution to the pair betweenness pb, laid out by
+	slots as returned by pair_slots, given the arrays dist, sigma and delta
+	of accumulate_source.
+	"""
+	pairV, pairU, pairW = slots
+	through = np.zeros(len(sigma))
+	np.divide(1 + delta, sigma, out=through, where=sigma > 0)
+	# unreached vertices and their neighbors all sit at -1, so they never
+	# look like a (parent, child) pair.
+	dv = dist[pairV]
+	up = dist[pairU] - dv
+	down = dist[pairW] - dv
+	forward = np.flatnonzero((up == -1) & (down == 1))
+	backward = np.flatnonzero((up == 1) & (down == -1))
+	pb[forward] += sigma[pairU[forward]] * through[pairW[forward]]
+	pb[backward] += sigma[pairW[backward]] * through[pairU[backward]]
+
+
+def accumulate_source_small(source, adjacency, eb, vb, pb=None, slots=None, cutoff=None):
+	"""
+	accumulate_source with the search and the dependency accumulation in
+	plain Python, on lists, for small graphs. adjacency lists the arcs
+	(v, u, eid) out of each vertex v in CSR order, and eb and vb are lists.
+	The levels are walked in the same order and every sum takes its terms in
+	the same order, so the scores are identical. The pair betweenness, one
+	pass for the whole source, is still added by NumPy.
+	"""
+	n = len(adjacency)
+	dist = [-1] * n
+	sigma = [0.] * n
+	dist[source] = 0
+	sigma[source] = 1.
+
+	levels = []
+	frontier = [source]
+	depth = 0
+	while frontier and (cutoff is None or depth < cutoff):
+		arcs = [arc for tail in frontier for arc in adjacency[tail]]
+		frontier = sorted({head for _, head, _ in arcs if dist[head] < 0})
+		for head in frontier:
+			dist[head] = depth + 1
+		arcs = [arc for arc in arcs if dist[arc[1]] == depth + 1]
+		for tail, head, _ in arcs:
+			sigma[head] += sigma[tail]
+		levels.append(arcs)
+		depth += 1
+
+	delta = [0.] * n
+	for arcs in reversed(levels):
+		flows = [sigma[tail] / sigma[head] * (1 + delta[head]) for tail, head, _ in arcs]
+		for (tail, head, eid), flow in zip(arcs, flows):
+			delta[tail] += flow
+			eb[eid] += flow
+	delta[source] = 0
+	for v in range(n):
+		vb[v] += delta[v]
+
+	if pb is not None and len(pb):
+		accumulate_pairs(np.array(dist), np.array(sigma), np.array(delta), pb, slots)
+
+
+def accumulate_sources(sources, indptr, indices, eids, ecount, offsets=None, slots=None, cutoff=None, squares=False):
+	"""
+	Sums the contributions of every vertex in sources to the edge, vertex and
+	pair betweenness. Returns a 3-tuple of arrays (eb, vb, pb) in which every
+	unordered pair of vertices is counted from both of its endpoints when
+	sources covers the whole graph. If squares is True, also returns the sum
+	of the squares of each source's contribution to the edge betweenness, as
+	a fourth array, from which a Sampler judges its error.
+
+	The NumPy passes of accumulate_source cost a roughly fixed amount per BFS
+	level, which dominates on small graphs, so graphs of at most
+	SMALL_GRAPH_EDGES edges are done in plain Python instead, with identical
+	results. The NumPy passes win on larger graphs.
+	"""
+	if ecount <= SMALL_GRAPH_EDGES:
+		return accumulate_sources_small(sources, indptr, indices, eids, ecount, offsets, slots, cutoff, squares)
+	eb = np.zeros(ecount)
+	vb = np.zeros(len(indptr) - 1)
+	pb = np.zeros(offsets[-1] if offsets is not None else 0)
+	if not squares:
+		for source in sources:
+			accumulate_source(source, indptr, indices, eids, eb, vb, pb, slots, cutoff)
+		return eb, vb, pb
+	eb2 = np.zeros(ecount)
+	step = np.zeros(ecount)
+	for source in sources:
+		step[:] = 0
+		accumulate_source(source, indptr, indices, eids, step, vb, pb, slots, cutoff)
+		eb += step
+		eb2 += step * step
+	return eb, vb, pb, eb2
+
+
+def accumulate_sources_small(sources, indptr, indices, eids, ecount, offsets=None, slots=None, cutoff=None,
+							squares=False):
+	"""
+	accumulate_sources a source at a time by accumulate_source_small.
+	"""
+	n = len(indptr) - 1
+	indptr, indices, eids = indptr.tolist(), indices.tolist(), eids.tolist()
+	adjacency = [list(zip(itertools.repeat(v), indices[indptr[v]:indptr[v + 1]], eids[indptr[v]:indptr[v + 1]]))
+				 for v in range(n)]
+	eb = [0.] * ecount
+	vb = [0.] * n
+	pb = np.zeros(offsets[-1] if offsets is not None else 0)
+	if not squares:
+		for source in sources:
+			accumulate_source_small(source, adjacency, eb, vb, pb, slots, cutoff)
+		return np.array(eb), np.array(vb), pb
+	eb2 = [0.] * ecount
+	for source in sources:
+		step = [0.] * ecount
+		accumulate_source_small(source, adjacency, step, vb, pb, slots, cutoff)
+		for e, x in enumerate(step):
+			eb[e] += x
+			eb2[e] += x * x
+	return np.array(eb), np.array(vb), pb, np.array(eb2)
+
+
+class Sampler(object):
+	"""
+	Estimates the edge, vertex and pair betweenness of a graph from a random
+	sample of source vertices rather than all of them, for graphs on which
+	exact betweenness takes too long.
+
+	Sources are drawn without replacement in rounds, the first of minimum
+	sources and each after that as large as all before it, and the totals
+	are scaled up by the number of candidate sources over the number drawn.
+	Sampling stops once the estimated relative standard error of the largest
+	edge betweenness, the score the divisive algorithms act on, is at most
+	epsilon. A graph with no more candidates than minimum is never sampled.
+	Since igraph's exact betweenness is several times faster per source than
+	a sampled one, component_betweenness only samples components of at
+	least threshold vertices.
+
+	The random draws come from a generator seeded with seed, so a run with
+	the same seed on the same graph gives the same estimates. A Sampler
+	pickles along with the state of its generator.
+	"""
+	def __init__(self, epsilon=0.1, seed=None, minimum=32, threshold=2000):
+		self.epsilon = epsilon
+		self.minimum = minimum
+		self.threshold = threshold
+		self._rng = np.random.default_rng(seed)
+
+
+	def betweenness(self, G, relevant=None, sources=None, cutoff=None, pool=None):
+		"""
+		Returns estimates of the Betweenness of G in the form returned by
+		edge_and_pair_betweenness, with sources (all vertices if None) the
+		candidates to sample from.
+		"""
+		indptr, indices, eids = csr_adjacency(G)
+		offsets, slots = pair_slots(indptr, indices, relevant)
+		candidates = np.arange(G.vcount()) if sources is None else np.asarray(sources, dtype=np.int64)
+		candidates = self._rng.permutation(candidates)
+		total = len(candidates)
+
+		sums = None
+		drawn = 0
+		size = self.minimum
+		while drawn < total:
+			batch = candidates[drawn:drawn + size]
+			if pool is None:
+				parts = accumulate_sources(batch, indptr, indices, eids, G.ecount(), offsets, slots, cutoff, squares=True)
+			else:
+				parts = pool.accumulate(G, batch, relevant, cutoff, squares=True)
+			sums = parts if sums is None else tuple(a + b for a, b in zip(sums, parts))
+			drawn += len(batch)
+			if drawn < total and self.error(sums[0], sums[3], drawn, total) <= self.epsilon:
+				break
+			size = drawn
+
+		if sums is None:
+			sums = accumulate_sources([], indptr, indices, eids, G.ecount(), offsets, slots, cutoff)
+		# every path was found once from each of its endpoints, and each
+		# source drawn stands for total / drawn of them.
+		scale = total / (2. * drawn) if drawn else .5
+		eb, vb, pb = sums[:3]
+		return Betweenness(eb * scale, vb * scale, pb * scale, offsets)
+
+
+	@staticmethod
+	def error(eb, eb2, drawn, total):
+		"""
+		Given the sums of the contributions of drawn sources out of total to
+		the edge betweenness, and of their squares, returns the estimated
+		relative standard error of the largest edge betweenness.
+		"""
+		if not len(eb):
+			return 0.
+		top = np.argmax(eb)
+		if eb[top] <= 0:
+			return 0.
+		if drawn < 2:
+			return np.inf
+		mean = eb[top] / drawn
+		variance = max(eb2[top] - drawn * mean * mean, 0.) / (drawn - 1)
+		# sampling without replacement: the error shrinks to 0 as drawn nears total.
+		return np.sqrt(variance / drawn * (1. - drawn / total)) / mean
+
+
+class BetweennessPool(object):
+	"""
+	A pool of worker processes that split the source vertices of
+	edge_and_pair_betweenness between them.
+
+	The graph is handed to the workers as a CSR adjacency in shared memory,
+	written once per call instead of pickled into every task. The shared
+	blocks are sized for a graph of at most vcapacity vertices and ecapacity
+	edges; CONGA never grows past n + 2m vertices and m edges.
+	"""
+	def __init__(self, workers, vcapacity, ecapacity):
+		self.workers = workers
+		self._vcapacity = vcapacity
+		self._ecapacity = ecapacity
+		sizes = {"header" : 2, "indptr" : vcapacity + 1, "indices" : 2 * ecapacity, "eids" : 2 * ecapacity}
+		self._blocks = {name : shared_memory.SharedMemory(create=True, size=8 * max(size, 1))
+						for name, size in sizes.items()}
+		self._arrays = {name : np.ndarray((sizes[name],), dtype=np.int64, buffer=block.buf)
+						for name, block in self._blocks.items()}
+		specs = {name : (block.name, sizes[name]) for name, block in self._blocks.items()}
+		self._pool = multiprocessing.Pool(workers, initializer=_attach_shared, initargs=(specs,))
+
+
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, *exc):
+		self.close()
+
+
+	def close(self):
+		"""
+		Shuts the workers down and releases the shared memory.
+		"""
+		self._pool.terminate()
+		self._pool.join()
+		# drop our views before closing, or the buffers can't be released.
+		self._arrays = {}
+		for block in self._blocks.values():
+			block.close()
+			block.unlink()
+		self._blocks = {}
+
+
+	def share(self, G):
+		"""
+		Writes the CSR adjacency of G into shared memory for the workers.
+		"""
+		n, m = G.vcount(), G.ecount()
+		if n > self._vcapacity or m > self._ecapacity:
+			raise ValueError("Graph has outgrown the shared memory of the pool.")
+		indptr, indices, eids = csr_adjacency(G)
+		self._arrays["header"][:] = (n, m)
+		self._arrays["indptr"][:n + 1] = indptr
+		self._arrays["indices"][:len(indices)] = indices
+		self._arrays["eids"][:len(eids)] = eids
+
+
+	def accumulate(self, G, sources, relevant=None, cutoff=None, squares=False):
+		"""
+		Shares G with the workers and has them accumulate the betweenness of
+		sources in shards, then merges the partial (eb, vb, pb) tables, and
+		the squares of the edge contributions if squares is True, by summing
+		them.
+		"""
+		self.share(G)
+		if relevant is not None:
+			relevant = list(relevant)
+		# a few shards per worker evens out the load when sources differ in cost.
+		shards = [shard for shard in np.array_split(np.asarray(sources, dtype=np.int64), 4 * self.workers) if len(shard)]
+		partials = self._pool.map(_accumulate_shard, [(shard, relevant, cutoff, squares) for shard in shards])
+		return tuple(sum(tables) for tables in zip(*partials))
+
+
+# The shared arrays of the BetweennessPool a worker process belongs to.
+_shared = {}
+
+
+def _attach_shared(specs):
+	"""
+	Pool initializer. Attaches the worker to the shared memory of its pool.
+	"""
+	for name, (blockName, size) in specs.items():
+		block = shared_memory.SharedMemory(name=blockName)
+		_shared[name] = (block, np.ndarray((size,), dtype=np.int64, buffer=block.buf))
+
+
+def _accumulate_shard(args):
+	"""
+	Accumulates the betweenness of one shard of source vertices on the graph
+	currently held in shared memory.
+	"""
+	sources, relevant, cutoff, squares = args
+	n, m = _shared["header"][1]
+	indptr = _shared["indptr"][1][:n + 1]
+	indices = _shared["indices"][1][:indptr[n]]
+	eids = _shared["eids"][1][:indptr[n]]
+	offsets, slots = pair_slots(indptr, indices, relevant)
+	return accumulate_sources(sources, indptr, indices, eids, m, offsets, slots, cutoff, squares)
+
+
+def edge_and_pair_betweenness(G, relevant=None, sources=None, cutoff=None, pool=None):
+	"""
+	Finds the edge, vertex and pair betweenness of the undirected graph G in
+	one pass per source vertex, without finding all shortest paths. When a
+	BetweennessPool is given, the sources are split among its workers.
+
+	Pair betweenness is only laid out for the vertices in relevant (all
+	vertices if relevant is None). Returns a Betweenness tuple of NumPy
+	arrays; the edge and vertex scores match G.edge_betweenness() and
+	G.betweenness(), and the pair scores of a vertex sum to its vertex
+	betweenness. Not guaranteed to work on multigraphs.
+	"""
+	indptr, indices, eids = csr_adjacency(G)
+	offsets, slots = pair_slots(indptr, indices, relevant)
+	if sources is None:
+		sources = range(G.vcount())
+	if pool is None or not len(sources):
+		eb, vb, pb = accumulate_sources(sources, indptr, indices, eids, G.ecount(), offsets, slots, cutoff)
+	else:
+		eb, vb, pb = pool.accumulate(G, sources, relevant, cutoff)
+	# every path was found once from each of its endpoints.
+	return Betweenness(eb / 2., vb / 2., pb / 2., offsets)
+
+
+def pair_betweenness_dict(G, pb, offsets, relevant):
+	"""
+	Converts the flat pair betweenness of the vertices in relevant into the
+	dict form dic[v][(u, w)] = c.
+	"""
+	return {v : dict(zip(itertools.combinations(G.neighbors(v), 2), pb[offsets[v]:offsets[v + 1]]))
+			for v in relevant}
+
+
+def component_betweenness(G, vertices, edgeAttr='eb', vertexAttr='vb', sampler=None):
+	"""
+	Recalculates the edge and vertex betweenness of only the connected
+	components of G that contain vertices, and stores them in the edge
+	attribute edgeAttr and the vertex attribute vertexAttr (skipped when
+	vertexAttr is None). Scores elsewhere in the graph are left untouched,
+	since a change to one component cannot affect any other. Returns the ids
+	of the edges whose scores were recalculated.
+
+	If a Sampler is given, the scores of each component of at least its
+	threshold vertices are estimated by it instead of calculated exactly.
+	"""
+	seen = set()
+	changed = []
+	for v in vertices:
+		if v in seen:
+			continue
+		component = sorted(G.subcomponent(v))
+		seen.update(component)
+		# induced_subgraph keeps the vertices in increasing id order.
+		sub = G.induced_subgraph(component)
+		pairs = [(component[a], component[b]) for a, b in sub.get_edgelist()]
+		sampled = sampler is not None and len(component) >= sampler.threshold
+		if sampled:
+			estimate = sampler.betweenness(sub, relevant=())
+		if pairs:
+			eids = G.get_eids(pairs)
+			G.es[eids][edgeAttr] = estimate.edge.tolist() if sampled else sub.edge_betweenness()
+			changed += eids
+		if vertexAttr is not None:
+			G.vs[component][vertexAttr] = estimate.vertex.tolist() if sampled else sub.betweenness()
+	return changed
@@ -0,0 +1,81 @@
+import os
+import pickle
+import time
+
+
+class Checkpoint(object):
+	"""
+	Saves the state of a long-running algorithm to a file every so often,
+	so that a run which is killed or preempted can resume from the last save
+	instead of starting over.
+
+	The state is any picklable object; the algorithms save their working
+	graph (with the betweennesses kept on it) and their split log. Each save
+	is tagged with a key describing the run, such as the algorithm, the size
+	of the input graph and its parameters, and a checkpoint saved under a
+	different key is refused rather than resumed.
+	"""
+	def __init__(self, path, key, interval=600):
+		"""
+		Checkpoints to path, at most once every interval seconds.
+		"""
+		self.path = path
+		self.key = key
+		self.interval = interval
+		self._last = time.time()
+
+
+	def load(self):
+		"""
+		Returns the last state saved for this run, or None if there is none.
+		Raises ValueError if the file holds a checkpoint of another run.
+		"""
+		if not os.path.exists(self.path):
+			return None
+		with open(self.path, 'rb') as f:
+			key, state = pickle.load(f)
+		if key != self.key:
+			raise ValueError("%s is a checkpoint of %r, not %r" % (self.path, key, self.key))
+		return state
+
+
+	def due(self):
+		"""
+		Returns True if the last save is at least interval seconds old.
+		"""
+		return time.time() - self._last >= self.interval
+
+
+	def save(self, state):
+		"""
+		Saves state. The file is replaced in one step, so a crash while
+		saving leaves the previous checkpoint intact.
+		"""
+		tmp = self.path + '.tmp'
+		with open(tmp, 'wb') as f:
+			pickle.dump((self.key, state), f, protocol=pickle.HIGHEST_PROTOCOL)
+		os.replace(tmp, self.path)
+		self._last = time.time()
+
+
+	def remove(self):
+		"""
+		Deletes the checkpoint, once the run it belongs to has finished.
+		"""
+		if os.path.exists(self.path):
+			os.remove(self.path)
+
+
+def checkpointer(path, key, interval):
+	"""
+	Returns a Checkpoint for the given path, or None if path is None.
+	"""
+	return None if path is None else Checkpoint(path, key, interval)
+
+
+def run_key(name, G, *params):
+	"""
+	Returns a key for a run of the algorithm name on the graph G with the
+	given parameters, telling apart graphs of the same size.
+	"""
+	return (name, G.vcount(), hash(tuple(G.get_edgelist()))) + params
@@ -1,99 +1,160 @@
 import numpy as np
-import collections as co
 import igraph as ig
-import operator
-import itertools
 import argparse
-from collections import Counter
+import heapq
 
 
 import circulo.algorithms.overlap
+import circulo.algorithms.betweenness
+import circulo.algorithms.connectivity
+import circulo.algorithms.priority
+import circulo.algorithms.checkpoint
 
 
 # Possible optimizations and notes:
 #   * Calculating the pair betweennesses is the large bottleneck.
-#       * However, calculation of all-pairs-shortest-paths
-#          and pair betweennesses are highly parallelizable.
-#   * Keep a record of splits or merges?
-#       * Right now, we store a lot of redundant information with a new
-#           VertexCover item for every split.
+#       * They are found in one Brandes-style pass per source vertex
+#          (see betweenness.py), which is highly parallelizable.
+#   * Only a log of the splits is kept (see overlap.SplitLog); covers
+#       are rebuilt from it when they are asked for.
 
-def conga(OG, calculate_modularities=None, optimal_count=None):
+def conga(OG, calculate_modularities=None, optimal_count=None, workers=None, max_clusters=None,
+          checkpoint=None, checkpoint_interval=600, epsilon=None, seed=None):
     """
     Defines the CONGA algorithm outlined in the Gregory 2007 paper
     (An Algorithm to Find Overlapping Community Structure in Networks)
 
-    Returns a CrispOverlap object of all of the covers.
-    """
+    If optimal_count or max_clusters is given, the algorithm stops as soon
+    as the graph has split into that many clusters (the smaller of the two
+    if both are given), so no covers with more clusters are produced.
 
-    G = OG.copy()
+    If workers is greater than 1, the pair betweennesses are computed by
+    that many processes, each taking a share of the source vertices, and
+    the modularities of the covers are scored by as many.
 
-    comm = G.components()
+    If epsilon is given, the edge, vertex and pair betweennesses are
+    estimated from a random sample of source vertices, large enough that
+    the largest edge betweenness has a relative standard error of about
+    epsilon (see betweenness.Sampler). seed seeds the sampling.
 
-    # Just in case the original graph is disconnected
-    nClusters = len(comm)
+    If checkpoint is a path, the working graph, its betweennesses and the
+    split log are saved there every checkpoint_interval seconds, and a run
+    on the same graph resumes from the last save. The file is deleted when
+    the run finishes.
 
-    # Store the original ids of all vertices
-    G.vs['CONGA_orig'] = [i.index for i in OG.vs]
-    allCovers = {nClusters : ig.VertexCover(OG)}
-    while G.es:
-        split = remove_edge_or_split_vertex(G)
-        if split:
-            comm = G.components().membership
-            cover = get_cover(G, OG, comm)
-            nClusters += 1
-            # short circuit stuff would go here.
-            allCovers[nClusters] = cover
+    Returns a CrispOverlap object of all of the covers.
+    """
+
+    cp = circulo.algorithms.checkpoint.checkpointer(checkpoint,
+                circulo.algorithms.checkpoint.run_key('conga', OG, epsilon, seed), checkpoint_interval)
+    state = cp.load() if cp is not None else None
+    if state is not None:
+        G, splitLog, nClusters, sampler = state
+    else:
+        G = OG.copy()
+        sampler = None
+        if epsilon is not None:
+            sampler = circulo.algorithms.betweenness.Sampler(epsilon, seed)
+
+        # Components are tracked as the graph is cut up, so that no split
+        # needs a search of the whole graph.
+        G['components'] = circulo.algorithms.connectivity.Components(G)
+
+        # Just in case the original graph is disconnected
+        nClusters = len(G['components'])
+
+        # Store the original ids of all vertices, and which vertex
+        # each copy made by a vertex split came from.
+        G.vs['CONGA_orig'] = [i.index for i in OG.vs]
+        G.vs['CONGA_parent'] = None
+        splitLog = circulo.algorithms.overlap.SplitLog(G.vcount(), nClusters)
+
+    # Splits never take CONGA past n + 2m vertices, which bounds the
+    # shared memory the pool needs.
+    pool = None
+    if workers is not None and workers > 1:
+        pool = circulo.algorithms.betweenness.BetweennessPool(workers,
+                                    OG.vcount() + 2 * OG.ecount(), OG.ecount())
+    limit = cluster_limit(optimal_count, max_clusters)
+    try:
+        while G.es and (limit is None or nClusters < limit):
+            split = remove_edge_or_split_vertex(G, pool, sampler)
+            if split:
+                splitLog.add_split(split[0], split[1], G.vcount())
+                nClusters += 1
+            if cp is not None and cp.due():
+                cp.save((G, splitLog, nClusters, sampler))
+    finally:
+        if pool is not None:
+            pool.close()
+    splitLog.finish(G.vs['CONGA_orig'], G.vs['CONGA_parent'], G['components'].membership)
+    if cp is not None:
+        cp.remove()
     if calculate_modularities is None: calculate_modularities = "lazar"
-    return circulo.algorithms.overlap.CrispOverlap(OG, allCovers,
+    return circulo.algorithms.overlap.CrispOverlap(OG, splitLog,
                                     modularity_measure=calculate_modularities,
-                                    optimal_count=optimal_count)
+                                    optimal_count=optimal_count, workers=workers)
 
 
-def remove_edge_or_split_vertex(G):
+def cluster_limit(optimal_count, max_clusters):
     """
-    The heart of the CONGA algorithm. Decides which edge should be
-    removed or which vertex should be split. Returns True if the
-    modification split the graph.
+    Returns the number of clusters at which a divisive run can stop,
+    or None if it should run until no edges are left.
     """
-    # has the graph split this iteration?
-    split = False
-    eb = G.edge_betweenness()
+    limits = [c for c in (optimal_count, max_clusters) if c is not None]
+    return min(limits) if limits else None
 
-    maxIndex, maxEb = max(enumerate(eb), key=operator.itemgetter(1))
-    # We might be able to calculate vertex betweenness and edge
-    # betweenness at the same time. The current implementation is slower
-    # than the builtin, though.
-    vb = G.betweenness()
+
+def remove_edge_or_split_vertex(G, pool=None, sampler=None):
+    """
+    The heart of the CONGA algorithm. Decides which edge should be
+    removed or which vertex should be split. If the modification split
+    the graph, returns the two vertices it separated, else None. pool is
+    an optional BetweennessPool used to compute the pair betweennesses,
+    and sampler an optional Sampler that estimates all betweennesses.
+    """
+
+    # The betweennesses are kept as attributes and only recalculated
+    # for the components that the last modification touched. Every edge
+    # gets an id that, unlike its igraph id, never changes, by which a
+    # MaxQueue finds the edge with the maximum betweenness. The queue is
+    # looked for rather than the scores, which the input graph may carry.
+    if 'ebQueue' not in G.attributes():
+        if sampler is None:
+            G.es['eb'] = G.edge_betweenness()
+            G.vs['vb'] = G.betweenness()
+        else:
+            circulo.algorithms.betweenness.component_betweenness(G, range(G.vcount()), sampler=sampler)
+        G.es['CONGA_id'] = range(G.ecount())
+        G['CONGA_edges'] = G.get_edgelist()
+        G['ebQueue'] = circulo.algorithms.priority.MaxQueue(enumerate(G.es['eb']))
+    vb = G.vs['vb']
+
+    maxId, maxEb = G['ebQueue'].peek()
 
     # Only consider vertices with vertex betweenness >= max
     # edge betweenness. From Gregory 2007 step 3
     vi = [i for i, b in enumerate(vb) if b > maxEb] #HERE TODO TODO
 
-    edge = G.es[maxIndex].tuple
+    edge = G['CONGA_edges'][maxId]
+    touched = edge
 
     if not vi:
         split = delete_edge(G, edge)
     else:
-        pb = pair_betweenness(G, vi)
+        pb = pair_betweenness(G, vi, pool, sampler)
         maxSplit, vNum, splitInstructions = max_split_betweenness(G, pb)
         if maxSplit > maxEb:
             split = split_vertex(G, vNum, splitInstructions[0])
+            touched = (vNum, G.vcount() - 1)
         else:
             split = delete_edge(G, edge)
-    return split
 
-
-def get_cover(G, OG, comm):
-    """
-    Given the graph, the original graph, and a community
-    membership list, returns a vertex cover of the communities
-    referring back to the original community.
-    """
-    coverDict = co.defaultdict(list)
-    for i, community in enumerate(comm):
-        coverDict[community].append(int(G.vs[i]['CONGA_orig']))
-    return ig.clustering.VertexCover(OG, clusters=list(coverDict.values()))
+    # Only the components holding the modified edge or vertex can change.
+    changed = G.es[circulo.algorithms.betweenness.component_betweenness(G, touched, sampler=sampler)]
+    for eid, score in zip(changed['CONGA_id'], changed['eb']):
+        G['ebQueue'].update(eid, score)
+    return touched if split else None
 
 
 def delete_edge(G, edge):
@@ -101,6 +162,7 @@ def delete_edge(G, edge):
     Given a graph G and one of its edges in tuple form, checks if the deletion
     splits the graph.
     """
+    remove_from_queue(G, [edge])
     G.delete_edges(edge)
     return check_for_split(G, edge)
 
@@ -109,11 +171,22 @@ def check_for_split(G, edge):
     """
     Given an edge in tuple form, check if it splits the
     graph into two disjoint clusters. If so, it returns
-    True. Otherwise, False.
+    True. Otherwise, False. G['components'] is kept up to date.
     """
     # Possibly keep a record of splits.
     if edge[0] == edge[1]: return False
-    return not G.edge_disjoint_paths(source=edge[0], target=edge[1])
+    return G['components'].separated(G, edge[0], edge[1])
+
+
+def remove_from_queue(G, edges):
+    """
+    Takes the given edges, in tuple form, out of the queue of edge
+    betweennesses, if there is one, before they are deleted.
+    """
+    if 'ebQueue' not in G.attributes():
+        return
+    for edge in edges:
+        G['ebQueue'].remove(G.es[G.get_eid(*edge)]['CONGA_id'])
 
 
 def split_vertex(G, v, splitInstructions):
@@ -125,58 +198,52 @@ def split_vertex(G, v, splitInstructions):
     new_index = G.vcount()
     G.add_vertex()
     G.vs[new_index]['CONGA_orig'] = G.vs[v]['CONGA_orig']
+    G.vs[new_index]['CONGA_parent'] = v
+    G['components'].add_vertex(v)
 
     # adding all relevant edges to new vertex, deleting from old one.
+    remove_from_queue(G, [(v, partner) for partner in splitInstructions])
     for partner in splitInstructions:
-        G.add_edge(new_index, partner)
+        G.add_edge(new_index, partner, CONGA_id=len(G['CONGA_edges']))
+        G['CONGA_edges'].append((new_index, partner))
         G.delete_edges((v, partner))
 
     # check if the two new vertices are disconnected.
     return check_for_split(G, (v, new_index))
 
 
-def order_tuple(toOrder):
-    """
-    Given a tuple (a, b), returns (a, b) if a <= b,
-    else (b, a).
-    """
-    if toOrder[0] <= toOrder[1]:
-        return toOrder
-    return (toOrder[1], toOrder[0])
-
-
-def update_betweenness(G, path, pair, count, relevant):
-    """
-    Given a shortest path in G, along with a count of paths
-    that length, to determine weight, updates the edge and
-    pair betweenness dicts with the path's new information.
-    """
-    weight = 1./count
-    pos = 0
-    while pos < len(path) - 2:
-        if path[pos + 1] in relevant:
-            pair[path[pos + 1]][order_tuple((path[pos], path[pos + 2]))] += weight
-        pos += 1
-
-
-def pair_betweenness(G, relevant):
+def pair_betweenness(G, relevant, pool=None, sampler=None):
     """
     Returns a dictionary of the pair betweenness of all vertices in relevant.
-
-    The structure of the returned dictionary is dic[v][(u, w)] = c, where c
-    is the number of shortest paths traverse through u, v, w.
-    """
-    pair_betweenness = {vertex : {uw : 0 for uw in itertools.combinations(G.neighbors(vertex), 2)} for vertex in relevant}
-
-    for i in G.vs:
-        pathCounts = Counter()
-        # Only find the shortest paths that we haven't already seen
-        shortest_paths_from_v = G.get_all_shortest_paths(i, to=G.vs[i.index+1:]) # here too. need all shortest paths. too bad.
-        for path in shortest_paths_from_v: # reads twice. Can I get it down to once?
-            pathCounts[path[-1]] += 1
-        for path in shortest_paths_from_v:
-            update_betweenness(G, path, pair_betweenness, pathCounts[path[-1]], set(relevant))
-    return pair_betweenness
+    The work is split over the workers of pool, a BetweennessPool, if given,
+    and the scores of the components of at least sampler.threshold vertices
+    are estimated by sampler, a Sampler, if given, as in component_betweenness.
+
+    The structure of the returned dictionary is dic[v] = a, where a is an array
+    holding, for every pair (u, w) of neighbors of v in the order of
+    itertools.combinations(G.neighbors(v), 2), the number of shortest paths
+    that traverse u, v, w.
+    """
+    # only paths within the components of the relevant vertices pass through them.
+    membership = G['components'].membership
+    sizes = G['components'].sizes
+    components = {membership[v] for v in relevant}
+    sampled = set()
+    if sampler is not None:
+        sampled = {c for c in components if sizes[c] >= sampler.threshold}
+
+    scores = {}
+    for group in (components - sampled, sampled):
+        if not group:
+            continue
+        vertices = [v for v in relevant if membership[v] in group]
+        sources = [u for u, c in enumerate(membership) if c in group]
+        if group is sampled:
+            result = sampler.betweenness(G, vertices, sources, pool=pool)
+        else:
+            result = circulo.algorithms.betweenness.edge_and_pair_betweenness(G, vertices, sources, pool=pool)
+        scores.update((v, result.pair[result.offsets[v]:result.offsets[v + 1]]) for v in vertices)
+    return {v : scores[v] for v in relevant}
 
 
 def create_clique(G, v, pb):
@@ -185,21 +252,16 @@ def create_clique(G, v, pb):
     representing all of its neighbors, with edge weights determined by the pair
     betweenness scores. Algorithm discussed on page 5 of the CONGA paper.
     """
-    neighbors = G.neighbors(v)
-
-    # map each neighbor to its index in the adjacency matrix
-    mapping = {neigh : i for i, neigh in enumerate(neighbors)}
-    n = len(neighbors)
+    n = len(G.neighbors(v))
 
     # Can use ints instead: (dtype=int). Only works if we use matrix_min
     # instead of mat_min.
     clique = np.matrix(np.zeros((n, n)))
 
-    for uw, score in pb.items():
-
-
-        clique[mapping[uw[0]], mapping[uw[1]]] = score
-        clique[mapping[uw[1]], mapping[uw[0]]] = score
+    # pb lists the neighbor pairs in upper triangular order.
+    upperTri = np.triu_indices(n, 1)
+    clique[upperTri] = pb
+    clique.T[upperTri] = pb
 
     # Ignore any self loops if they're there. If not, this line
     # does nothing and can be removed.
@@ -223,23 +285,79 @@ def max_split_betweenness(G, dic):
     for v in dic:
         clique = create_clique(G, v,dic[v])
 
-        # initialize a list on how we will map the neighbors to the collapsing matrix
-        vMap = [[ve] for ve in G.neighbors(v)]
-
-        # we want to keep collapsing the matrix until we have a 2x2 matrix and its
-        # score. Then we want to remove index j from our vMap list and concatenate
-        # it with the vMap[i]. This begins building a way of keeping track of how
-        # we are splitting the vertex and its neighbors
-        while clique.size > 4:
-            i,j,clique = reduce_matrix(clique)
-            vMap[i] += vMap.pop(j)
-        if clique[0,1] >= vMax:
-            vMax = clique[0,1]
+        # collapse the clique down to two groups of neighbors, and map the
+        # groups of rows back to the neighbors they stand for.
+        score, groups = agglomerate(clique)
+        neighbors = G.neighbors(v)
+        if score >= vMax:
+            vMax = score
             vNum = v
-            vSpl = vMap
+            vSpl = [[neighbors[i] for i in group] for group in groups]
     return vMax,vNum,vSpl
 
 
+def agglomerate(clique):
+    """
+    Given a symmetric clique matrix of at least two rows, repeatedly collapses
+    the pair of rows with the minimum value into one, as reduce_matrix does,
+    until two rows are left. This is the greedy "collapse" discussed in CONGA.
+
+    Rows are merged in place under an active-row mask instead of being
+    deleted, and a heap holds the minimum of every row, so each collapse only
+    rescans the rows whose minimum it touched. Ties are broken exactly as
+    mat_min breaks them.
+
+    Returns a tuple (score, groups) where score is the value between the two
+    remaining rows and groups lists the original rows collapsed into each.
+    """
+    M = np.array(clique, dtype=float)
+    n = M.shape[0]
+    active = np.ones(n, dtype=bool)
+    groups = [[i] for i in range(n)]
+
+    # each row keeps the minimum (and its column) over the active columns to
+    # its right, so (value, row, column) pops in the order mat_min scans.
+    bestCol = np.full(n, -1)
+    bestVal = np.full(n, np.inf)
+    heap = []
+    update_row_minima(M, active, np.arange(n), bestCol, bestVal, heap)
+
+    for _ in range(n - 2):
+        # skip entries made stale by an earlier collapse.
+        while True:
+            value, i, j = heapq.heappop(heap)
+            if active[i] and active[j] and bestCol[i] == j and bestVal[i] == value:
+                break
+        active[j] = False
+        M[i, :] += M[j, :]
+        M[:, i] += M[:, j]
+        groups[i] += groups[j]
+        groups[j] = None
+
+        # values only grow, so only rows whose minimum sat in column i or j
+        # can have a new one.
+        stale = np.flatnonzero(active & ((bestCol == i) | (bestCol == j)))
+        update_row_minima(M, active, np.union1d(stale, [i]), bestCol, bestVal, heap)
+
+    a, b = np.flatnonzero(active)
+    return M[a, b], [groups[a], groups[b]]
+
+
+def update_row_minima(M, active, rows, bestCol, bestVal, heap):
+    """
+    Helper for agglomerate. Finds the minimum of each of rows over the active
+    columns to its right, and pushes it onto heap.
+    """
+    block = np.where(active & (np.arange(M.shape[0]) > rows[:, np.newaxis]), M[rows], np.inf)
+    cols = block.argmin(axis=1)
+    vals = block[np.arange(len(rows)), cols]
+    bestCol[rows] = cols
+    bestVal[rows] = vals
+    for row, col, val in zip(rows.tolist(), cols.tolist(), vals.tolist()):
+        if val != np.inf:
+            heapq.heappush(heap, (val, row, col))
+
+
 def matrix_min(mat):
     """
     Given a symmetric matrix, find an index of the minimum value
@@ -287,7 +405,8 @@ def reduce_matrix(M):
     Given a matrix M, collapses the row and column of the minimum value. This is just
     an adjacency matrix way of implementing the greedy "collapse" discussed in CONGA.
 
-    Returns the new matrix and the collapsed indices.
+    Returns the new matrix and the collapsed indices. Currently unused;
+    agglomerate does all of the collapsing in place.
     """
     i,j = mat_min(M)
     #i, j = matrix_min(M)
@@ -337,6 +456,11 @@ def main():
                    help="""Calculate the modularities using the specified
                             modularity measure. Currently only supports lazar.""")
     parser.add_argument('-n', '--num_clusters', type=int, help="""Specify the number of clusters to use.""")
+    parser.add_argument('-x', '--max_clusters', type=int, help="""Stop once the graph has split into this many clusters.""")
+    parser.add_argument('-w', '--workers', type=int, help="""Number of processes used to compute pair betweenness.""")
+    parser.add_argument('-c', '--checkpoint', help="""Save progress to this file now and then, and resume from it if it exists.""")
+    parser.add_argument('-e', '--epsilon', type=float, help="""Estimate betweenness from sampled sources to about this relative error.""")
+    parser.add_argument('-s', '--seed', type=int, help="""Seed for the sampling of sources.""")
     parser.add_argument('-d', '--demo', action='store_true', help="""Run a demo with the famous Zachary's Karate Club data set. Overrides all other options.""")
     parser.add_argument('-l', '--label', default='CONGA_index', nargs='?', const='label', help="""Choose which attribute of the graph to print.
                             When this option is present with no parameters, defaults to 'label'. When the option is not
@@ -354,7 +478,8 @@ def main():
 
     # only works for undirected
     G = ig.read(args.file).as_undirected()
-    result = conga(G, calculate_modularities=args.modularity_measure, optimal_count=args.num_clusters)
+    result = conga(G, calculate_modularities=args.modularity_measure, optimal_count=args.num_clusters, workers=args.workers,
+                   max_clusters=args.max_clusters, checkpoint=args.checkpoint, epsilon=args.epsilon, seed=args.seed)
     result.pretty_print_cover(result.optimal_count, label=args.label)
 
 
@@ -0,0 +1,97 @@
+import circulo.algorithms.conga as CONGA
+import unittest
+import os
+import tempfile
+import igraph
+
+class TestCongaFunctions(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Initializes the graph for testing to Zachary's
+        karate club.
+        """
+        self.graph = igraph.Graph.Famous("zachary")
+
+
+    def tearDown(self):
+        self.graph = None
+
+
+    def test_sampling_below_threshold(self):
+        """
+        Checks that on a graph smaller than the sampler's threshold every
+        betweenness stays exact, so sampling leaves the covers unchanged.
+        """
+        exact = CONGA.conga(self.graph)
+        sampled = CONGA.conga(self.graph, epsilon=0.1, seed=1)
+        self.assertEqual([list(cover) for cover in sampled], [list(cover) for cover in exact])
+
+
+    def test_checkpoint(self):
+        """
+        Checks that a run killed part way through resumes from its
+        checkpoint and finds the same covers as an uninterrupted run,
+        with and without a pool of workers.
+        """
+        for workers in (None, 2):
+            expected = CONGA.conga(self.graph, workers=workers)
+            path = os.path.join(tempfile.mkdtemp(), 'conga.ckpt')
+            step, calls = CONGA.remove_edge_or_split_vertex, []
+            def crash(*args):
+                calls.append(args)
+                if len(calls) == 40:
+                    raise KeyboardInterrupt
+                return step(*args)
+            CONGA.remove_edge_or_split_vertex = crash
+            try:
+                self.assertRaises(KeyboardInterrupt, CONGA.conga, self.graph, workers=workers,
+                                  checkpoint=path, checkpoint_interval=0)
+            finally:
+                CONGA.remove_edge_or_split_vertex = step
+            self.assertTrue(os.path.exists(path))
+            result = CONGA.conga(self.graph, workers=workers, checkpoint=path)
+            self.assertFalse(os.path.exists(path))
+            self.assertEqual(list(result.modularities.items()), list(expected.modularities.items()))
+            self.assertEqual([list(cover) for cover in result], [list(cover) for cover in expected])
+
+
+    def test_max_clusters(self):
+        """
+        Checks that a run given max_clusters stops once the graph has
+        split into that many clusters, that its last cover has that many,
+        and that its covers are those of a full run.
+        """
+        step, calls = CONGA.remove_edge_or_split_vertex, []
+        def counted(*args):
+            calls.append(args)
+            return step(*args)
+        CONGA.remove_edge_or_split_vertex = counted
+        try:
+            full = CONGA.conga(self.graph)
+            fullSteps = len(calls)
+            del calls[:]
+            early = CONGA.conga(self.graph, max_clusters=4)
+        finally:
+            CONGA.remove_edge_or_split_vertex = step
+        self.assertLess(len(calls), fullSteps)
+        self.assertEqual(len(early), 4)
+        self.assertEqual(len(early[4]), 4)
+        for k in range(1, 5):
+            self.assertEqual(list(early[k]), list(full[k]))
+
+
+    def test_betweenness_attributes(self):
+        """
+        Checks that a graph that already has eb and vb attributes is
+        treated like any other, its scores recalculated from scratch.
+        """
+        expected = CONGA.conga(self.graph)
+        self.graph.es['eb'] = 1.
+        self.graph.vs['vb'] = 1.
+        result = CONGA.conga(self.graph)
+        self.assertEqual([list(cover) for cover in result], [list(cover) for cover in expected])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,4 @@
-from collections import Counter, defaultdict
+from collections import Counter
 import itertools
 import igraph as ig
 import numpy as np
@@ -6,225 +6,289 @@ import operator
 import logging
 import argparse
 
-from circulo.algorithms import overlap
+from circulo.algorithms import overlap, betweenness, connectivity, priority
+from circulo.algorithms.checkpoint import checkpointer, run_key
+from circulo.algorithms.conga import cluster_limit, agglomerate
 
 
 # TODO:
 #    * only call fix_betweennesses when needed
 
-def congo(OG, h=2):
+def congo(OG, h=2, optimal_count=None, max_clusters=None, checkpoint=None, checkpoint_interval=600,
+          epsilon=None, seed=None):
     """
     Provides an Implementation of the CONGO algorithm defined by Steve Gregory
     in his 2010 paper "A Fast Algorithm to Find Overlapping Communities in Networks."
     The parameters are OG, the graph on which the analysis is to be performed, and h,
     the length of the longest shortest path that Congo is to consider.
+
+    If optimal_count or max_clusters is given, the algorithm stops as soon as
+    the graph has split into that many clusters (the smaller of the two if both
+    are given).
+
+    If checkpoint is a path, the working graph, its betweennesses and the
+    split log are saved there every checkpoint_interval seconds, and a run
+    on the same graph with the same h resumes from the last save. The file
+    is deleted when the run finishes.
+
+    If epsilon is given, the initial betweennesses are estimated from a
+    random sample of source vertices, large enough that the largest edge
+    betweenness has a relative standard error of about epsilon (see
+    betweenness.Sampler); seed seeds the sampling. The local updates after
+    each removal or split stay exact. Since each source only reaches paths
+    of length h, small h needs a large sample.
+
+    The initial betweennesses match those of listing every shortest path
+    only to rounding. Edges and splits whose scores tie exactly are
+    therefore chosen by floating-point noise. From the first such tie the
+    removal order, and so many of the intermediate covers, can differ from
+    the path-listing version, and on some graphs so can the number of
+    covers.
     """
 
     logging.basicConfig(filename='congo.log',level=logging.DEBUG)
-    G = OG.copy()
 
     # Just in case the original graph is disconnected
-    if not G.is_connected():
+    if not OG.is_connected():
         raise RuntimeError("Congo only makes sense for connected graphs.")
 
-    # initializing attributes of copied graph
-    G.vs['CONGA_orig'] = [i.index for i in OG.vs]
-    G.es['eb'] = 0
-    G.vs['pb'] = [{uw : 0 for uw in itertools.combinations(G.neighbors(vertex), 2)} for vertex in G.vs]
-
-    # initializing all pair and edge betweennesses
-    do_initial_betweenness(G, h)
-    nClusters = 1
-
-    # The first cover is simply the entire connected graph.
-    allCovers = {nClusters : ig.VertexCover(OG)}
-    while G.es:
+    cp = checkpointer(checkpoint, run_key('congo', OG, h, epsilon, seed), checkpoint_interval)
+    state = cp.load() if cp is not None else None
+    if state is not None:
+        G, splitLog, nClusters, splitCache = state
+    else:
+        G = OG.copy()
+
+        # initializing attributes of copied graph
+        G.vs['CONGA_orig'] = [i.index for i in OG.vs]
+        G.vs['CONGA_parent'] = None
+        G['eb'] = EdgeBetweenness(G)
+        G['pb'] = PairBetweenness(G)
+        G['components'] = connectivity.Components(G)
+
+        # initializing all pair and edge betweennesses
+        sampler = betweenness.Sampler(epsilon, seed) if epsilon is not None else None
+        do_initial_betweenness(G, h, sampler)
+        nClusters = 1
+
+        # the best split of every vertex examined so far, dropped whenever its
+        # pair betweennesses may have changed.
+        splitCache = {}
+
+        # The first cover is simply the entire connected graph. Later ones
+        # are rebuilt from a log of the splits.
+        splitLog = overlap.SplitLog(G.vcount(), nClusters)
+    limit = cluster_limit(optimal_count, max_clusters)
+    while G.es and (limit is None or nClusters < limit):
 
         logging.info("%d edges remaining", len(G.es))
         # get the edge with the max edge betweenness, and its betweenness.
-        maxEdge, maxEb = max(enumerate(G.es['eb']), key=operator.itemgetter(1))
-        G.vs['vb'] = G.betweenness(cutoff=h)
+        maxEdge, maxEb = G['eb'].max()
+        vb = vertex_betweeenness_from_eb(G)
 
         # since split betweennes is upper bounded by vertex betweenness, we
         # only need to look at the vertices for which the vertex betweenness
-        # is greater than the max edge betweenness. (We multiply by 2
-        # because our edge betweenness calculations yield values in both
-        # directions.)
-
-        # TODO check if I need to multiply by 2
-        vInteresting = [i for i, b in enumerate(G.vs['vb']) if 2 * b > maxEb]
+        # is greater than the max edge betweenness. (Both count paths in
+        # both directions.)
+        vInteresting = np.flatnonzero(vb > maxEb).tolist()
 
         logging.info("Vertices to examine: %s", vInteresting)
-        splitInstr = max_split_betweenness(G, vInteresting)
+        splitInstr = max_split_betweenness(G, vInteresting, splitCache)
 
         # split if max split betweenness > max edge betweenness
         if splitInstr is None or splitInstr[0] <= maxEb:
-            split = delete_edge(G, maxEdge, h)
+            separated = maxEdge
+            split = delete_edge(G, maxEdge, h, splitCache)
         else:
-            split = split_vertex(G, splitInstr[1], splitInstr[2], h)
-
-
+            split = split_vertex(G, splitInstr[1], splitInstr[2], h, splitCache)
+            separated = (splitInstr[1], G.vcount() - 1)
 
         if split:
             # there must be a new community
-            comm = G.components().membership
-            cover = get_cover(G, OG, comm)
+            splitLog.add_split(separated[0], separated[1], G.vcount())
             nClusters += 1
-            # short circuit stuff would go here.
-            allCovers[nClusters] = cover
-    return overlap.CrispOverlap(OG, allCovers)
+        if cp is not None and cp.due():
+            cp.save((G, splitLog, nClusters, splitCache))
+    splitLog.finish(G.vs['CONGA_orig'], G.vs['CONGA_parent'], G['components'].membership)
+    if cp is not None:
+        cp.remove()
+    return overlap.CrispOverlap(OG, splitLog, optimal_count=optimal_count)
 
 
-def delete_edge(G, edge, h):
+def delete_edge(G, edge, h, splitCache=None):
     """
     Given a graph G and one of its edges in tuple form, checks if the deletion
-    splits the graph.
+    splits the graph. Any cached splits of vertices whose pair betweennesses
+    may change are dropped from splitCache.
     """
 
 
-    tup = G.es[edge].tuple
+    tup = edge
 
     logging.info("Deleted: %s", tup)
 
     neighborhood = get_neighborhood_edge(G, tup, h)
+    invalidate_splits(splitCache, neighborhood)
     # subtracts local betweennesses in the region, as discussed
     # in the paper
     do_local_betweenness(G, neighborhood, h, operator.neg)
-    G.delete_edges(edge)
-    fix_betweennesses(G)
+    G.delete_edges([edge])
+    G['eb'].delete_edges([edge])
+    fix_betweennesses(G, tup)
     # adds back in local betweennesses after the deletion
     do_local_betweenness(G, neighborhood, h, operator.pos)
     return check_for_split(G, tup)
 
 
 
-def fix_pair_betweennesses(G):
-    """
-    Given a graph G, makes sure that all of the pair betweennesses
-    listed as attributes remain possible, and removes those that are not.
-    Also adds new attributes where new edges have been added.
-    """
-    for v in G.vs:
-        toDel = []
-        neededPairs = {uw for uw in itertools.combinations(G.neighbors(v), 2)}
-        for pair in v['pb']:
-            if pair not in neededPairs:
-                toDel.append(pair)
-        for d in toDel:
-            del v['pb'][d]
-        for pair in neededPairs:
-            if pair not in v['pb']:
-                v['pb'][pair] = 0
-
-
-def fix_edge_betweennesses(G):
+def fix_pair_betweennesses(G, vertices):
     """
-    Given a graph G, makes sure that every edge has a betweenness
-    score assigned to it.
+    Given a graph G and the vertices whose neighbors have changed, lays
+    out their pair betweennesses again so that only possible pairs are
+    kept, with new pairs starting at zero.
     """
-    for e in G.es:
-        if e['eb'] is None:
-            e['eb'] = 0
+    for v in vertices:
+        G['pb'].set_neighbors(v, G.neighbors(v))
 
 
-def fix_betweennesses(G):
+def fix_betweennesses(G, vertices):
     """
-    Fixes the pair and edge betweennesses such that every attribute is up to date.
+    Fixes the pair betweennesses such that every attribute is up to date,
+    given the vertices whose neighbors have changed. (Edge betweennesses
+    are kept up to date as edges are added and deleted.)
     """
-    fix_pair_betweennesses(G)
-    fix_edge_betweennesses(G)
+    fix_pair_betweennesses(G, vertices)
 
 
-def split_vertex(G, vToSplit, instr, h):
+def split_vertex(G, vToSplit, instr, h, splitCache=None):
     """
     Splits the vertex v into two new vertices, each with
     edges depending on s. Returns True if the split
-    divided the graph, else False.
+    divided the graph, else False. Any cached splits of vertices
+    whose pair betweennesses may change are dropped from splitCache.
     """
     neighborhood = get_neighborhood_vertex(G, vToSplit, h)
+    invalidate_splits(splitCache, neighborhood)
     do_local_betweenness(G, neighborhood, h, operator.neg)
     new_index = G.vcount()
     G.add_vertex()
     G.vs[new_index]['CONGA_orig'] = G.vs[vToSplit]['CONGA_orig']
-    G.vs[new_index]['pb'] = {uw : 0 for uw in itertools.combinations(G.neighbors(vToSplit), 2)}
+    G.vs[new_index]['CONGA_parent'] = vToSplit
+    G['pb'].add_vertex()
+    G['eb'].add_vertex()
+    G['components'].add_vertex(vToSplit)
 
     # adding all relevant edges to new vertex, deleting from old one.
     toAdd = list(zip(itertools.repeat(new_index), instr[0]))
     toDelete = list(zip(itertools.repeat(vToSplit), instr[0]))
     G.add_edges(toAdd)
     G.delete_edges(toDelete)
+    G['eb'].add_edges(toAdd)
+    G['eb'].delete_edges(toDelete)
     neighborhood.append(new_index)
-    fix_betweennesses(G)
+    fix_betweennesses(G, [vToSplit, new_index] + list(instr[0]))
     logging.info("split: %d, %s", vToSplit, instr)
     do_local_betweenness(G, neighborhood, h, operator.pos)
     # check if the two new vertices are disconnected.
     return check_for_split(G, (vToSplit, new_index))
 
 
-def max_split_betweenness(G, vInteresting):
+def max_split_betweenness(G, vInteresting, splitCache=None):
     """
     Performs the greedy algorithm discussed in the 2007 CONGA paper
     to approximate the maximum split betweenness. Returns a tuple
     (a, b, c) where a is the maximum score, b the vertex to split
     to acheive the score, and c a list of the instructions for which
     neighbors to connect to each side of the split.
+
+    If splitCache is given, the best split of each vertex is looked
+    up there first and stored there once found.
     """
+    if splitCache is None:
+        splitCache = {}
     maxSplitBetweenness = 0
     vToSplit = None
     # for every vertex of interest, we want to figure out the maximum score achievable
     # by splitting the vertices in various ways, and return that optimal split
     for v in vInteresting:
-        clique = create_clique(G, v, G.vs['pb'][v])
-        if clique.size < 4:
+        if v not in splitCache:
+            splitCache[v] = vertex_split(G, v)
+        if splitCache[v] is None:
             continue
+        score, instructions = splitCache[v]
 
-        # initialize a list on how we will map the neighbors to the collapsing matrix
-        vMap = [[ve] for ve in G.neighbors(v)]
-
-        # we want to keep collapsing the matrix until we have a 2x2 matrix and its
-        # score. Then we want to remove index j from our vMap list and concatenate
-        # it with the vMap[i]. This begins building a way of keeping track of how
-        # we are splitting the vertex and its neighbors
-        while clique.size > 4:
-            i,j,clique = reduce_matrix(clique)
-            vMap[i] += vMap.pop(j)
-
-        if clique[0,1] >= maxSplitBetweenness:
-            maxSplitBetweenness = clique[0,1]
+        if score >= maxSplitBetweenness:
+            maxSplitBetweenness = score
             vToSplit = v
-            splitInstructions = vMap
+            splitInstructions = instructions
     if vToSplit is None:
         return None
 
     return maxSplitBetweenness, vToSplit, splitInstructions
 
 
-def do_initial_betweenness(G, h):
+def vertex_split(G, v):
+    """
+    Finds the best split of the vertex v by the greedy algorithm. Returns
+    a tuple (a, b) where a is the split betweenness and b the instructions
+    for which neighbors to connect to each side, or None if v has fewer
+    than two neighbors.
+    """
+    clique = create_clique(G, v, G['pb'][v])
+    if clique.size < 4:
+        return None
+
+    # collapse the clique down to two groups of neighbors, and map the
+    # groups of rows back to the neighbors they stand for.
+    score, groups = agglomerate(clique)
+    neighbors = G.neighbors(v)
+    return score, [[neighbors[i] for i in group] for group in groups]
+
+
+def invalidate_splits(splitCache, vertices):
+    """
+    Drops the cached splits of vertices from splitCache. Only the pair
+    betweennesses within the neighborhood of a modification change, so
+    every other cached split stays valid.
+    """
+    if splitCache is None:
+        return
+    for v in vertices:
+        splitCache.pop(v, None)
+
+
+def do_initial_betweenness(G, h, sampler=None):
     """
     Given a graph G and a depth h, calculates all edge and pair betweennesses
-    and updates G's attributes to reflect the new scores.
+    and updates G's attributes to reflect the new scores. If a Sampler is
+    given, the scores are estimated by it instead.
+
+    Rather than listing every shortest path of length at most h, runs a BFS
+    cut off at depth h from each vertex and accumulates path counts and
+    dependencies one source at a time, as in Brandes' algorithm.
     """
     # Not guaranteed to work on multigraphs.
-    all_pairs_shortest_paths = []
-    # Counter for normalizing scores
-    pathCounts = Counter()
-    for ver in G.vs:
-        logging.info("initializing betweennesses for %d", ver.index)
-        neighborhood = get_neighborhood_vertex(G, ver, h)
-        neighborhood.remove(ver.index)
-        #for i, v in enumerate(neighborhood):
-        s_s_shortest_paths = G.get_all_shortest_paths(ver, to=neighborhood)#[i+1:])
-        all_pairs_shortest_paths += s_s_shortest_paths
-
-    # to ignore duplicate edges, uncomment the next line.
-    #all_pairs_shortest_paths = set(tuple(p) for p in all_pairs_shortest_paths)
-    for path in all_pairs_shortest_paths:
-        pathCounts[(path[0], path[-1])] += 1
+    logging.info("initializing betweennesses...")
+    if sampler is None:
+        indptr, indices, eids = betweenness.csr_adjacency(G)
+        offsets, slots = betweenness.pair_slots(indptr, indices)
+        # every path is counted once from each of its endpoints, as CONGO expects.
+        eb, _, pb = betweenness.accumulate_sources(range(G.vcount()), indptr, indices, eids,
+                                                   G.ecount(), offsets, slots, cutoff=h)
+    else:
+        # the estimates count every path once; CONGO counts it from both ends.
+        estimate = sampler.betweenness(G, cutoff=h)
+        eb, pb, offsets = 2 * estimate.edge, 2 * estimate.pair, estimate.offsets
 
     logging.info("updating all betweenness attributes...")
-    for path in all_pairs_shortest_paths:
-        if len(path) <= h + 1:
-            update_betweenness(G, path, pathCounts[(path[0], path[-1])], operator.pos)
+    edges = np.array(G.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    G['eb'].add(G['eb'].eids(edges[:, 0], edges[:, 1]), eb)
+    # every vertex within distance h of v is the far end of a path from v,
+    # and of one back, each of total weight one.
+    G['eb'].add_endpoints(range(G.vcount()), 2. * (np.array(G.neighborhood_size(order=h)) - 1))
+    for v in range(G.vcount()):
+        scores = G['pb'][v]
+        scores += pb[offsets[v]:offsets[v + 1]]
 
 
 def do_local_betweenness(G, neighborhood, h, op=operator.pos):
@@ -246,57 +310,50 @@ def do_local_betweenness(G, neighborhood, h, op=operator.pos):
         if len(neighSet | set(path)) == neighSize:
             pathCounts[(path[0], path[-1])] += 1 # can improve
             apsp.append(path)
-    for path in apsp:
-        if len(path) <= h + 1:
-            update_betweenness(G, path, pathCounts[(path[0], path[-1])], op)
-
-
-def update_betweenness(G, path, count, op):
-    """
-    Given a shortest path in G, along with a count of paths
-    that length, to determine weight, updates the edge and
-    pair betweenness dicts with the path's new information.
-    """
-    weight = op(1./count)
-    pos = 0
-    while pos < len(path) - 2:
-        G.vs[path[pos + 1]]['pb'][order_tuple((path[pos], path[pos + 2]))] += weight
-        G.es[G.get_eid(path[pos], path[pos + 1])]['eb'] += weight
-        pos += 1
-    if pos < len(path) - 1:
-        G.es[G.get_eid(path[pos], path[pos + 1])]['eb'] += weight
-
-
-def get_cover(G, OG, comm):
-    """
-    Given the graph, the original graph, and a community
-    membership list, returns a vertex cover of the communities
-    referring back to the original community.
-    """
-    coverDict = defaultdict(list)
-    for i, community in enumerate(comm):
-        coverDict[community].append(int(G.vs[i]['CONGA_orig']))
-    return ig.clustering.VertexCover(OG, clusters=list(coverDict.values()))
-
-
-def vertex_betweeenness_from_eb(G, eb):
-    """
-    Calculates the vertex betweenness scores in G. Returns a list
-    in which the indices are the vertex indices and the values are
-    their betweeennesses. The same as G.betweenness(), but faster because
-    it uses the edge betweenness scores.
+    # a vertex's path to itself has no hops, and is not the end of a path.
+    paths = [path for path in apsp if 1 < len(path) <= h + 1]
+    update_betweenness(G, paths, [pathCounts[(path[0], path[-1])] for path in paths], op)
+
+
+def update_betweenness(G, paths, counts, op):
+    """
+    Given a batch of shortest paths in G, along with the count of
+    paths of that length between the same endpoints, to determine their
+    weights, updates the edge and pair betweennesses with the paths' new
+    information. The whole batch is applied at once.
+
+    The paths are laid end to end in one array, and the edge ids and pair
+    slots of all of their hops are looked up together, in path order.
+    """
+    eb = G['eb']
+    pb = G['pb']
+    lengths = np.fromiter(map(len, paths), dtype=np.int64, count=len(paths))
+    vertices = np.fromiter(itertools.chain.from_iterable(paths), dtype=np.int64, count=lengths.sum())
+    weights = op(1. / np.asarray(counts, dtype=float))
+    # the path each of vertices belongs to.
+    owner = np.repeat(np.arange(len(paths)), lengths)
+    # vertices[k] starts a hop if vertices[k + 1] is on the same path, and a
+    # pair around vertices[k + 1] if vertices[k + 2] is.
+    hops = np.flatnonzero(owner[1:] == owner[:-1])
+    pairs = np.flatnonzero(owner[2:] == owner[:-2])
+    starts = np.cumsum(lengths) - lengths
+    ends = np.stack((vertices[starts], vertices[starts + lengths - 1]), axis=1).ravel()
+    eb.add(eb.eids(vertices[hops], vertices[hops + 1]), weights[owner[hops]])
+    eb.add_endpoints(ends, np.repeat(weights, 2))
+    pb.add(pb.slots(vertices[pairs + 1], vertices[pairs], vertices[pairs + 2]), weights[owner[pairs]])
+
+
+def vertex_betweeenness_from_eb(G):
+    """
+    Returns an array in which the indices are the vertex indices and the
+    values are their betweeennesses, counting paths in both directions.
+    The same as 2 * G.betweenness(cutoff=h) after do_initial_betweenness,
+    but much faster because it uses the edge betweenness scores, whose
+    per-vertex sums are kept up to date as the scores change.
 
     (CONGA, page 4, equation 1)
     """
-    components = G.components()
-    membership = components.membership
-    vbs = []
-    for vertex in G.vs:
-        numComponents = len(components[membership[vertex.index]])
-        incidentEdges = G.incident(vertex)
-        vb = .5 * (sum(G.es[e]['eb'] for e in incidentEdges) - (numComponents - 1))
-        vbs.append(vb)
-    return vbs
+    return G['eb'].vertex_betweenness()
 
 
 def get_neighborhood_vertex(G, v, h):
@@ -331,18 +388,16 @@ def create_clique(G, v, pb):
     representing all of its neighbors, with edge weights determined by the pair
     betweenness scores. Algorithm discussed on page 5 of the CONGA paper.
     """
-    neighbors = G.neighbors(v)
-
-    # map each neighbor to its index in the adjacency matrix
-    mapping = {neigh : i for i, neigh in enumerate(neighbors)}
-    n = len(neighbors)
+    n = len(G.neighbors(v))
 
     # Can use ints instead: (dtype=int). Only works if we use matrix_min
     # instead of mat_min.
     clique = np.matrix(np.zeros((n, n)))
-    for uw, score in pb.items():
-        clique[mapping[uw[0]], mapping[uw[1]]] = score
-        clique[mapping[uw[1]], mapping[uw[0]]] = score
+
+    # pb lists the neighbor pairs in upper triangular order.
+    upperTri = np.triu_indices(n, 1)
+    clique[upperTri] = pb
+    clique.T[upperTri] = pb
 
     # Ignore any self loops if they're there. If not, this line
     # does nothing and can be removed.
@@ -350,12 +405,175 @@ def create_clique(G, v, pb):
     return clique
 
 
+class PairBetweenness(object):
+    """
+    The pair betweenness of every vertex of a graph, stored flat in one NumPy
+    array. The slots of a vertex hold one score for every pair of its
+    neighbors, in the order of itertools.combinations(G.neighbors(v), 2), and
+    start at the offset of the vertex.
+
+    When the neighbors of a vertex change, only its slots are laid out again,
+    at the end of the array. The array is compacted once more than half of it
+    is no longer in use.
+
+    The slots of a whole batch of pairs are found at once (see slots) from a
+    sorted array of (vertex, neighbor) keys, built again only after the
+    neighbors of some vertex have changed.
+    """
+    def __init__(self, G):
+        self._neighbors = [np.array(G.neighbors(v), dtype=np.int64) for v in range(G.vcount())]
+        self._sizes = [pair_count(len(n)) for n in self._neighbors]
+        self._offsets = [0] * len(self._sizes)
+        self._scores = np.zeros(2 * sum(self._sizes) + 1)
+        self._end = 0
+        for v, size in enumerate(self._sizes):
+            self._offsets[v] = self._end
+            self._end += size
+        self._live = self._end
+        self._index = None
+
+
+    def __getitem__(self, v):
+        """
+        Returns a view of the pair betweennesses of v.
+        """
+        return self._scores[self._offsets[v]:self._offsets[v] + self._sizes[v]]
+
+
+    def neighbors(self, v):
+        """
+        Returns the neighbors of v that its slots are laid out for.
+        """
+        return self._neighbors[v]
+
+
+    def slot(self, v, u, w):
+        """
+        Returns the index into the flat array of the pair (u, w) of v.
+        """
+        return int(self.slots([v], [u], [w])[0])
+
+
+    def slots(self, v, u, w):
+        """
+        Given arrays of vertices v and of pairs (u, w) of their neighbors,
+        returns an array of the indices of the pairs into the flat array.
+        """
+        stride, keys, offsets, degrees = self._lookup()
+        v = np.asarray(v, dtype=np.int64)
+        i = np.searchsorted(keys, v * stride + u) - offsets[v]
+        j = np.searchsorted(keys, v * stride + w) - offsets[v]
+        i, j = np.minimum(i, j), np.maximum(i, j)
+        return np.asarray(self._offsets, dtype=np.int64)[v] + pair_index(i, j, degrees[v])
+
+
+    def _lookup(self):
+        """
+        Returns (stride, keys, offsets, degrees), where keys holds
+        v * stride + u for every neighbor u of every vertex v in sorted
+        order, the keys of v start at offsets[v], and degrees[v] is the
+        number of neighbors of v.
+        """
+        if self._index is None:
+            stride = len(self._neighbors)
+            degrees = np.array([len(n) for n in self._neighbors], dtype=np.int64)
+            offsets = np.zeros(stride, dtype=np.int64)
+            np.cumsum(degrees[:-1], out=offsets[1:])
+            # each vertex's neighbors are sorted, so the keys come out sorted.
+            keys = np.concatenate([v * stride + n for v, n in enumerate(self._neighbors)] +
+                                  [np.zeros(0, dtype=np.int64)])
+            self._index = stride, keys, offsets, degrees
+        return self._index
+
+
+    def add(self, slots, weights):
+        """
+        Adds weights to the pair betweennesses in slots, as returned by slot.
+        """
+        np.add.at(self._scores, np.asarray(slots, dtype=np.int64), weights)
+
+
+    def add_vertex(self):
+        """
+        Adds a vertex without neighbors to the end of the store.
+        """
+        self._neighbors.append(np.zeros(0, dtype=np.int64))
+        self._sizes.append(0)
+        self._offsets.append(self._end)
+        self._index = None
+
+
+    def set_neighbors(self, v, neighbors):
+        """
+        Lays the slots of v out again for its new (sorted) neighbors.
+        Pairs that still exist keep their scores, and new ones start at zero.
+        """
+        old = self._neighbors[v]
+        new = np.array(neighbors, dtype=np.int64)
+        if np.array_equal(old, new):
+            return
+        scores = np.zeros(pair_count(len(new)))
+
+        # move the scores of the pairs whose neighbors both survived.
+        if len(old) > 1 and len(new) > 1:
+            position = np.minimum(np.searchsorted(new, old), len(new) - 1)
+            survived = new[position] == old
+            i, j = np.triu_indices(len(old), 1)
+            kept = survived[i] & survived[j]
+            scores[pair_index(position[i[kept]], position[j[kept]], len(new))] = self[v][kept]
+
+        self._live += len(scores) - self._sizes[v]
+        self._reserve(len(scores))
+        self._index = None
+        self._neighbors[v] = new
+        self._sizes[v] = len(scores)
+        self._offsets[v] = self._end
+        self._scores[self._end:self._end + len(scores)] = scores
+        self._end += len(scores)
+
+
+    def _reserve(self, size):
+        """
+        Makes room for size more slots at the end of the array, compacting
+        or growing it as needed.
+        """
+        if self._end + size <= len(self._scores):
+            return
+        if self._live + size > len(self._scores) // 2:
+            scores = np.zeros(2 * (self._live + size))
+        else:
+            scores = np.zeros(len(self._scores))
+        end = 0
+        for v, count in enumerate(self._sizes):
+            scores[end:end + count] = self[v]
+            self._offsets[v] = end
+            end += count
+        self._scores = scores
+        self._end = end
+
+
+def pair_count(degree):
+    """
+    Returns the number of pairs of neighbors of a vertex of the given degree.
+    """
+    return degree * (degree - 1) // 2
+
+
+def pair_index(i, j, degree):
+    """
+    Returns where the pair of neighbors at positions i < j falls in the
+    order of itertools.combinations for a vertex of the given degree.
+    """
+    return i * (2 * degree - i - 1) // 2 + (j - i - 1)
+
+
 def reduce_matrix(M):
     """
     Given a matrix M, collapses the row and column of the minimum value. This is just
     an adjacency matrix way of implementing the greedy "collapse" discussed in CONGA.
 
-    Returns the new matrix and the collapsed indices.
+    Returns the new matrix and the collapsed indices. Currently unused;
+    agglomerate does all of the collapsing in place.
     """
     i,j = mat_min(M)
     #i, j = matrix_min(M)
@@ -372,18 +590,176 @@ def reduce_matrix(M):
     return i,j,M
 
 
+class EdgeBetweenness(object):
+    """
+    The edge betweenness of a graph in one contiguous float64 array, indexed
+    by edge ids that, unlike igraph's, stay the same as other edges are added
+    and deleted. A hashed map from (u, v) finds the id of an edge, and for a
+    whole batch of edges at once, a sorted array of their keys (see eids).
+
+    New edges take the next free id, so ids keep the order igraph gives the
+    same edges, and the first edge with the maximum score is the same. Edges
+    are kept with the smaller endpoint first, as igraph keeps them, since the
+    local updates walk the neighborhood of an edge from its first endpoint.
+
+    For every vertex, the sum of the betweennesses of its incident edges and
+    the weight of the paths that end at it are kept as well, so that vertex
+    betweenness can be derived from them (see vertex_betweenness). A MaxQueue
+    over the edge scores finds the edge with the maximum betweenness without
+    scanning every edge.
+    """
+    def __init__(self, G):
+        m = G.ecount()
+        self._eids = {}
+        self._edges = []
+        self._scores = np.full(max(2 * m, 1), -np.inf)
+        self._ends = np.zeros((len(self._scores), 2), dtype=np.int64)
+        self._vcount = G.vcount()
+        self._incident = np.zeros(max(2 * self._vcount, 1))
+        self._endpoint = np.zeros(len(self._incident))
+        self._queue = priority.MaxQueue()
+        self._index = None
+        self.add_edges(G.get_edgelist())
+
+
+    def __len__(self):
+        """
+        Returns the number of edges.
+        """
+        return len(self._eids)
+
+
+    def __getitem__(self, eid):
+        """
+        Returns the betweenness of the edge with the given id.
+        """
+        return self._scores[eid]
+
+
+    def eid(self, u, v):
+        """
+        Returns the id of the edge between u and v.
+        """
+        return self._eids[order_tuple((u, v))]
+
+
+    def eids(self, u, v):
+        """
+        Given arrays of the ends u and v of edges, returns an array of the
+        ids of the edges.
+        """
+        stride, keys, ids = self._lookup()
+        u = np.asarray(u, dtype=np.int64)
+        v = np.asarray(v, dtype=np.int64)
+        return ids[np.searchsorted(keys, np.minimum(u, v) * stride + np.maximum(u, v))]
+
+
+    def _lookup(self):
+        """
+        Returns (stride, keys, ids), where keys holds u * stride + v for
+        every edge (u, v) with u <= v in sorted order, and ids the ids of
+        the edges in the same order.
+        """
+        if self._index is None:
+            ids = np.fromiter(self._eids.values(), dtype=np.int64, count=len(self._eids))
+            ends = self._ends[ids]
+            keys = ends.min(axis=1) * self._vcount + ends.max(axis=1)
+            order = np.argsort(keys)
+            self._index = self._vcount, keys[order], ids[order]
+        return self._index
+
+
+    def add_vertex(self):
+        """
+        Makes room for a new vertex, with no incident edges.
+        """
+        self._index = None
+        if self._vcount == len(self._incident):
+            for name in ('_incident', '_endpoint'):
+                sums = np.zeros(2 * self._vcount)
+                sums[:self._vcount] = getattr(self, name)
+                setattr(self, name, sums)
+        self._vcount += 1
+
+
+    def add_edges(self, edges):
+        """
+        Gives each of edges, in tuple form, a new id and a betweenness of zero.
+        """
+        self._index = None
+        for edge in edges:
+            end = len(self._edges)
+            if end == len(self._scores):
+                scores = np.full(2 * end, -np.inf)
+                scores[:end] = self._scores
+                self._scores = scores
+                self._ends = np.concatenate((self._ends, np.zeros_like(self._ends)))
+            self._eids[order_tuple(edge)] = end
+            self._edges.append(order_tuple(tuple(edge)))
+            self._ends[end] = edge
+            self._scores[end] = 0
+            self._queue.update(end, 0.)
+
+
+    def delete_edges(self, edges):
+        """
+        Forgets each of edges, in tuple form. Their ids are not reused.
+        """
+        self._index = None
+        for edge in edges:
+            eid = self._eids.pop(order_tuple(edge))
+            self._incident[self._ends[eid]] -= self._scores[eid]
+            self._scores[eid] = -np.inf
+            self._queue.remove(eid)
+
+
+    def add(self, eids, weights):
+        """
+        Adds weights to the betweennesses of the edges with the given ids.
+        """
+        eids = np.asarray(eids, dtype=np.int64)
+        np.add.at(self._scores, eids, weights)
+        np.add.at(self._incident, self._ends[eids, 0], weights)
+        np.add.at(self._incident, self._ends[eids, 1], weights)
+        changed = np.unique(eids)
+        for eid, score in zip(changed.tolist(), self._scores[changed].tolist()):
+            self._queue.update(eid, score)
+
+
+    def add_endpoints(self, vertices, weights):
+        """
+        Adds weights to the paths ending at vertices, once for every end.
+        """
+        np.add.at(self._endpoint, np.asarray(vertices, dtype=np.int64), weights)
+
+
+    def vertex_betweenness(self):
+        """
+        Returns an array of the vertex betweenness of every vertex, counting
+        paths in both directions like the edge scores. A path through v adds
+        its weight to two edges incident to v, while a path ending at v adds
+        it to only one, so half of the incident sum less the weight of the
+        paths ending at v is the betweenness of v. (CONGA, page 4, equation 1)
+        """
+        return .5 * (self._incident[:self._vcount] - self._endpoint[:self._vcount])
+
+
+    def max(self):
+        """
+        Returns the first edge, in tuple form, with the maximum betweenness,
+        along with that betweenness.
+        """
+        eid, score = self._queue.peek()
+        return self._edges[eid], score
+
+
 def check_for_split(G, edge):
     """
     Given an edge in tuple form, check if it splits the
     graph into two disjoint clusters. If so, it returns
-    True. Otherwise, False.
+    True. Otherwise, False. G['components'] is kept up to date.
     """
-    # Possibly keep a record of splits.
-    try:
-        return not G.edge_disjoint_paths(source=edge[0], target=edge[1])
-        # TODO: specify exception (when edge = target)
-    except Exception as e:
-        return False
+    return G['components'].separated(G, edge[0], edge[1])
 
 
 def mat_min(M):
@@ -448,7 +824,11 @@ def main():
                             When this option is present with no parameters, defaults to 'label'. When the option is not
                             present, defaults to the index.""")
     parser.add_argument('-n', '--num_clusters', type=int, help="""Specify the number of clusters to use.""")
+    parser.add_argument('-x', '--max_clusters', type=int, help="""Stop once the graph has split into this many clusters.""")
     parser.add_argument('-w', '--height', default=2, type=int, help="""The lengh of the longest shortest paths that CONGO considers.""")
+    parser.add_argument('-c', '--checkpoint', help="""Save progress to this file now and then, and resume from it if it exists.""")
+    parser.add_argument('-e', '--epsilon', type=float, help="""Estimate the initial betweenness from sampled sources to about this relative error.""")
+    parser.add_argument('-s', '--seed', type=int, help="""Seed for the sampling of sources.""")
     parser.add_argument('file', nargs='?', help="""The path to the file in igraph readable format.""")
     args = parser.parse_args()
     if args.demo:
@@ -461,11 +841,9 @@ def main():
 
     # only works for undirected
     G = ig.read(args.file).as_undirected()
-    result = congo(G, args.height)
-    if args.num_clusters:
-        result.pretty_print_cover(args.num_clusters, label=args.label)
-    else:
-        result.pretty_print_cover(result.optimal_count, label=args.label)
+    result = congo(G, args.height, optimal_count=args.num_clusters, max_clusters=args.max_clusters,
+                   checkpoint=args.checkpoint, epsilon=args.epsilon, seed=args.seed)
+    result.pretty_print_cover(result.optimal_count, label=args.label)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,13 @@
 import circulo.algorithms.congo as CONGO
+import circulo.algorithms.betweenness as betweenness
+import circulo.algorithms.connectivity as connectivity
+import circulo.algorithms.overlap as overlap
 import unittest
+import os
+import tempfile
 import igraph
 import itertools
+import numpy as np
 
 class TestCongoFunctions(unittest.TestCase):
 
@@ -12,8 +18,8 @@ class TestCongoFunctions(unittest.TestCase):
         """
         self.graph = igraph.Graph.Famous("zachary")
         self.graph.vs['CONGA_orig'] = [i.index for i in self.graph.vs]
-        self.graph.es['eb'] = 0
-        self.graph.vs['pb'] = [{uw : 0 for uw in itertools.combinations(self.graph.neighbors(vertex), 2)} for vertex in self.graph.vs]
+        self.graph['eb'] = CONGO.EdgeBetweenness(self.graph)
+        self.graph['pb'] = CONGO.PairBetweenness(self.graph)
 
 
     def tearDown(self):
@@ -37,9 +43,22 @@ class TestCongoFunctions(unittest.TestCase):
         graph.edge_betweenness.
         """
         ebtheirs = self.graph.edge_betweenness()
-        ebmine, _ = CONGO.edge_and_pair_betweenness(self.graph)
+        ebmine = betweenness.edge_and_pair_betweenness(self.graph).edge
         for e in self.graph.es:
-            self.assertAlmostEqual(ebtheirs[e.index], ebmine[e.tuple])
+            self.assertAlmostEqual(ebtheirs[e.index], ebmine[e.index])
+
+
+    def test_vertex_betweenness(self):
+        """
+        Checks that the vertex betweenness found alongside the edge
+        and pair betweenness matches igraph's graph.betweenness, with
+        and without a cutoff.
+        """
+        for cutoff in (None, 2):
+            vbtheirs = self.graph.betweenness(cutoff=cutoff)
+            vbmine = betweenness.edge_and_pair_betweenness(self.graph, cutoff=cutoff).vertex
+            for v in self.graph.vs:
+                self.assertAlmostEqual(vbtheirs[v.index], vbmine[v.index])
 
 
     def test_pair_betweenness(self):
@@ -47,32 +66,277 @@ class TestCongoFunctions(unittest.TestCase):
         Checks to make sure that the sum of all pair betweennesses
         on a specific vertex are equal to its vertex betweenness.
         """
-        _, pb = CONGO.edge_and_pair_betweenness(self.graph)
+        result = betweenness.edge_and_pair_betweenness(self.graph)
         vb = self.graph.betweenness()
-        for v in pb:
-            self.assertAlmostEqual(sum(pb[v].values()), vb[v])
+        for v in self.graph.vs:
+            pb = result.pair[result.offsets[v.index]:result.offsets[v.index + 1]]
+            self.assertAlmostEqual(sum(pb), vb[v.index])
 
 
-    # def test_vertex_betweeenness_from_eb(self):
-    #   """
-    #   Checks that the implementation of vertex_betweeenness_from_eb
-    #   yields the same results as that of igraph's graph.betweenness
-    #   """
-    #   eb = self.graph.edge_betweenness()
-    #   ebmine, _ = CONGO.edge_and_pair_betweenness(self.graph)
-    #   vbtheirs = self.graph.betweenness()
-    #   vbmine = CONGO.vertex_betweeenness_from_eb(self.graph, ebmine)
-    #   for v in self.graph.vs:
-    #       self.assertAlmostEqual(vbtheirs[v.index], vbmine[v.index])
+    def test_pooled_betweenness(self):
+        """
+        Checks that splitting the sources over a BetweennessPool
+        gives the same scores as a single process.
+        """
+        serial = betweenness.edge_and_pair_betweenness(self.graph)
+        with betweenness.BetweennessPool(2, self.graph.vcount(), self.graph.ecount()) as pool:
+            pooled = betweenness.edge_and_pair_betweenness(self.graph, pool=pool)
+        for mine, theirs in zip(pooled, serial):
+            for a, b in zip(mine, theirs):
+                self.assertAlmostEqual(a, b)
+
+
+    def test_small_graph_betweenness(self):
+        """
+        Checks that the plain Python accumulation used on small graphs
+        gives exactly the scores of the NumPy one, on a graph with an
+        isolated part, for some pairs, a cutoff and summed squares.
+        """
+        G = self.graph + igraph.Graph.Famous("Krackhardt_Kite") + igraph.Graph(2)
+        indptr, indices, eids = betweenness.csr_adjacency(G)
+        for relevant, cutoff, squares in ((None, None, False), ([0, 2, 33, 40], 2, True)):
+            offsets, slots = betweenness.pair_slots(indptr, indices, relevant)
+            args = (range(G.vcount()), indptr, indices, eids, G.ecount(), offsets, slots, cutoff, squares)
+            small = betweenness.accumulate_sources_small(*args)
+            size = betweenness.SMALL_GRAPH_EDGES
+            betweenness.SMALL_GRAPH_EDGES = -1
+            try:
+                full = betweenness.accumulate_sources(*args)
+            finally:
+                betweenness.SMALL_GRAPH_EDGES = size
+            self.assertEqual([list(a) for a in small], [list(a) for a in full])
+
+
+    def test_component_betweenness(self):
+        """
+        Checks that recalculating only the components touched by
+        a deletion leaves every score equal to a full recalculation.
+        """
+        self.graph.es['eb'] = self.graph.edge_betweenness()
+        self.graph.vs['vb'] = self.graph.betweenness()
+        for edge in [(0, 31), (0, 8), (2, 8), (13, 33), (19, 33), (2, 27), (2, 28), (2, 32)]:
+            self.graph.delete_edges([edge])
+            betweenness.component_betweenness(self.graph, edge)
+        for e, eb in zip(self.graph.es, self.graph.edge_betweenness()):
+            self.assertAlmostEqual(e['eb'], eb)
+        for v, vb in zip(self.graph.vs, self.graph.betweenness()):
+            self.assertAlmostEqual(v['vb'], vb)
+
+
+    def test_split_log(self):
+        """
+        Checks that covers rebuilt from a SplitLog match the
+        components of the working graph at the time of each split.
+        """
+        G = self.graph.copy()
+        G.vs['CONGA_parent'] = None
+        G['components'] = connectivity.Components(G)
+        log = overlap.SplitLog(G.vcount(), 1)
+        covers = {1 : [list(range(G.vcount()))]}
+        # split vertex 0, then cut the graph apart edge by edge.
+        self.assertTrue(CONGO.split_vertex(G, 0, [[4, 5, 6, 10]], 2))
+        log.add_split(0, G.vcount() - 1, G.vcount())
+        covers[2] = [[G.vs[v]['CONGA_orig'] for v in c] for c in G.components()]
+        for edge in [(0, 31), (0, 8), (2, 8), (13, 33), (19, 33), (2, 27), (2, 28), (2, 32)] + G.get_edgelist():
+            if G.get_eid(*edge, error=False) < 0:
+                continue
+            G.delete_edges([edge])
+            if CONGO.check_for_split(G, edge):
+                log.add_split(edge[0], edge[1], G.vcount())
+                covers[len(covers) + 1] = [[G.vs[v]['CONGA_orig'] for v in c] for c in G.components()]
+        log.finish(G.vs['CONGA_orig'], G.vs['CONGA_parent'], G['components'].membership)
+        result = overlap.CrispOverlap(self.graph, log)
+        self.assertEqual(len(result), len(covers))
+        for k, cover in covers.items():
+            self.assertEqual(list(result[k]), cover)
+
+
+    def test_checkpoint(self):
+        """
+        Checks that a run killed part way through resumes from its
+        checkpoint and finds the same covers as an uninterrupted run.
+        """
+        expected = CONGO.congo(self.graph, 2)
+        path = os.path.join(tempfile.mkdtemp(), 'congo.ckpt')
+        deleteEdge, calls = CONGO.delete_edge, []
+        def crash(*args):
+            calls.append(args)
+            if len(calls) == 40:
+                raise KeyboardInterrupt
+            return deleteEdge(*args)
+        CONGO.delete_edge = crash
+        try:
+            self.assertRaises(KeyboardInterrupt, CONGO.congo, self.graph, 2, checkpoint=path, checkpoint_interval=0)
+        finally:
+            CONGO.delete_edge = deleteEdge
+        self.assertTrue(os.path.exists(path))
+        result = CONGO.congo(self.graph, 2, checkpoint=path)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(list(result.modularities.items()), list(expected.modularities.items()))
+        self.assertEqual([list(cover) for cover in result], [list(cover) for cover in expected])
+
+
+    def test_sampler(self):
+        """
+        Checks that sampled betweenness is exact once every source is drawn,
+        is reproducible for a seed, and stays close on a larger graph.
+        """
+        exact = betweenness.edge_and_pair_betweenness(self.graph)
+        estimate = betweenness.Sampler(0, seed=1).betweenness(self.graph)
+        self.assertTrue(np.allclose(estimate.edge, exact.edge))
+        self.assertTrue(np.allclose(estimate.vertex, exact.vertex))
+        self.assertTrue(np.allclose(estimate.pair, exact.pair))
+
+        G = self.graph.copy()
+        betweenness.component_betweenness(G, [0], sampler=betweenness.Sampler(0, threshold=0))
+        self.assertTrue(np.allclose(G.es['eb'], self.graph.edge_betweenness()))
+
+        H = igraph.Graph.Lattice([20, 20], circular=False)
+        first = betweenness.Sampler(.1, seed=7, minimum=16).betweenness(H, relevant=())
+        second = betweenness.Sampler(.1, seed=7, minimum=16).betweenness(H, relevant=())
+        self.assertTrue((first.edge == second.edge).all())
+        ebs = np.array(H.edge_betweenness())
+        top = np.argmax(ebs)
+        self.assertLess(abs(first.edge[top] / ebs[top] - 1), .3)
+
+
+    def test_max_clusters(self):
+        """
+        Checks that stopping early at max_clusters yields the same
+        covers as a full run, up to that many clusters.
+        """
+        full = CONGO.congo(self.graph)
+        early = CONGO.congo(self.graph, max_clusters=4)
+        self.assertEqual(len(early), 4)
+        for k in range(1, 5):
+            self.assertEqual(list(early[k]), list(full[k]))
+
+
+    def test_split_cache(self):
+        """
+        Checks that every split looked up in the cache is the one found
+        afresh, and that the covers are the same with and without the
+        cache, on a graph where removals change the pair betweennesses
+        of vertices whose splits were cached.
+        """
+        maxSplit, seen, changed = CONGO.max_split_betweenness, {}, []
+        def checked(G, vInteresting, splitCache=None):
+            for v in vInteresting:
+                fresh = CONGO.vertex_split(G, v)
+                if v in splitCache:
+                    self.assertEqual(splitCache[v], fresh)
+                if v in seen and seen[v] != fresh:
+                    changed.append(v)
+                seen[v] = fresh
+            return maxSplit(G, vInteresting, splitCache)
+        def uncached(G, vInteresting, splitCache=None):
+            return maxSplit(G, vInteresting)
+        try:
+            CONGO.max_split_betweenness = checked
+            cached = CONGO.congo(self.graph, 2)
+            CONGO.max_split_betweenness = uncached
+            expected = CONGO.congo(self.graph, 2)
+        finally:
+            CONGO.max_split_betweenness = maxSplit
+        self.assertTrue(changed)
+        self.assertEqual([list(cover) for cover in cached], [list(cover) for cover in expected])
+
+
+    def test_edge_store_orientation(self):
+        """
+        Checks that the edge store gives added edges back in the same
+        orientation igraph does, since CONGO's local updates visit the
+        neighborhood of an edge starting from its first endpoint.
+        """
+        eb = self.graph['eb']
+        self.graph.add_vertex()
+        eb.add_vertex()
+        self.graph.add_edges([(34, 2)])
+        eb.add_edges([(34, 2)])
+        eb.add([eb.eid(2, 34)], [100.])
+        self.assertEqual(eb.max()[0], self.graph.es[self.graph.get_eid(2, 34)].tuple)
+
+
+    def test_edge_store_lookup(self):
+        """
+        Checks that looking up a batch of edges finds the same ids as
+        looking them up one at a time, as edges are added and deleted.
+        """
+        eb = self.graph['eb']
+        eb.delete_edges([(0, 1), (32, 33)])
+        eb.add_vertex()
+        eb.add_edges([(34, 2), (0, 34)])
+        edges = [e for e in self.graph.get_edgelist() if e not in ((0, 1), (32, 33))] + [(34, 2), (0, 34)]
+        ids = eb.eids([v for v, _ in edges], [u for _, u in edges])
+        self.assertEqual(list(ids), [eb.eid(u, v) for v, u in edges])
+        self.assertEqual(list(eb.eids([2, 33], [34, 31])), [eb.eid(2, 34), eb.eid(31, 33)])
+
+
+    def test_pair_store(self):
+        """
+        Checks that laying out the pairs of a vertex again keeps the
+        scores of the pairs that survive and zeroes the new ones.
+        """
+        pb = self.graph['pb']
+        for v in self.graph.vs:
+            pb[v.index][:] = range(len(pb[v.index]))
+        before = {uw : pb[0][pb.slot(0, *uw) - pb.slot(0, 1, 2)]
+                  for uw in itertools.combinations(self.graph.neighbors(0), 2)}
+        pb.add_vertex()
+        pb.set_neighbors(0, [1, 2, 3, 5, 34])
+        for uw in itertools.combinations([1, 2, 3, 5, 34], 2):
+            self.assertEqual(pb[0][pb.slot(0, *uw) - pb.slot(0, 1, 2)], before.get(uw, 0))
+        self.assertEqual(len(pb[0]), 10)
+        self.assertEqual(list(pb[33]), list(range(len(pb[33]))))
+
+
+    def test_agglomerate(self):
+        """
+        Checks that the in-place agglomeration collapses the clique
+        exactly as repeated calls to reduce_matrix do, ties included.
+        """
+        rng = np.random.RandomState(41)
+        for n in range(2, 20):
+            M = np.triu(rng.randint(0, 4, (n, n)).astype(float), 1)
+            M = np.matrix(M + M.T)
+            score, groups = CONGO.agglomerate(M)
+            vMap = [[i] for i in range(n)]
+            while M.size > 4:
+                i, j, M = CONGO.reduce_matrix(M)
+                vMap[i] += vMap.pop(j)
+            self.assertEqual(score, M[0, 1])
+            self.assertEqual(groups, vMap)
+
+
+    def test_vertex_betweeenness_from_eb(self):
+        """
+        Checks that the vertex betweenness derived from the edge
+        betweenness matches that of igraph's graph.betweenness, both
+        at the start and after a vertex split and an edge deletion.
+        """
+        G = self.graph
+        G.vs['CONGA_parent'] = None
+        G['components'] = connectivity.Components(G)
+        CONGO.do_initial_betweenness(G, 2)
+        for step in range(3):
+            if step == 1:
+                CONGO.split_vertex(G, 0, [[4, 5, 6, 10]], 2)
+            elif step == 2:
+                CONGO.delete_edge(G, (32, 33), 2)
+            vbtheirs = G.betweenness(cutoff=2)
+            vbmine = CONGO.vertex_betweeenness_from_eb(G)
+            for v in G.vs:
+                self.assertAlmostEqual(2 * vbtheirs[v.index], vbmine[v.index])
 
 
     def test_initialize_betweenness(self):
         cp = self.graph.copy()
 
-        eb = self.graph.edge_betweenness()
+        eb = self.graph.edge_betweenness(cutoff=3)
         CONGO.do_initial_betweenness(cp, 3)
         for i, e in enumerate(eb):
-            self.assertAlmostEqual(e, cp.es[i]['eb'])
+            # CONGO counts every path from both of its endpoints.
+            self.assertAlmostEqual(2 * e, cp['eb'][cp['eb'].eid(*cp.es[i].tuple)])
 
 
 # def testBetweennesses(G, h):
@@ -83,7 +347,7 @@ class TestCongoFunctions(unittest.TestCase):
 
 def suite():
     suite = unittest.TestSuite()
-    tests = ['test_test', 'test_vertex_betweeenness_from_eb', 'test_edge_betweenness', 'test_pair_betweenness']
+    tests = ['test_test', 'test_edge_betweenness', 'test_vertex_betweenness', 'test_pair_betweenness']
 
     return unittest.TestSuite(list(map(TestCongoFunctions, tests)))
 
@@ -0,0 +1,186 @@
+from collections import deque
+
+import igraph as ig
+
+
+def separated_side(G, u, v):
+	"""
+	Answers whether u and v of the undirected graph G, which were connected
+	before the last removal, are still connected. Returns None if they are,
+	and otherwise the set of vertices in the component of whichever of u and
+	v was exhausted first. G may also be given as a list of the neighbor sets
+	of its vertices, for callers that keep those up to date themselves.
+
+	Runs a BFS from u and one from v, always growing the side that has seen
+	fewer vertices, and stops as soon as the two meet or one side runs out.
+	When the removal did disconnect u and v the work is bounded by the
+	smaller of the two new components rather than the whole graph.
+	"""
+	if u == v:
+		return None
+	neighbors = G.neighbors if isinstance(G, ig.Graph) else G.__getitem__
+	seen = ({u}, {v})
+	queues = (deque([u]), deque([v]))
+	while queues[0] and queues[1]:
+		side = 0 if len(seen[0]) <= len(seen[1]) else 1
+		mine, theirs = seen[side], seen[1 - side]
+		for w in neighbors(queues[side].popleft()):
+			if w in theirs:
+				return None
+			if w not in mine:
+				mine.add(w)
+				queues[side].append(w)
+	return seen[0] if not queues[0] else seen[1]
+
+
+def separated(G, u, v):
+	"""
+	Returns True if u and v of the undirected graph G, which were connected
+	before the last removal, no longer are. See separated_side.
+	"""
+	return separated_side(G, u, v) is not None
+
+
+class Components(object):
+	"""
+	The connected component membership of an undirected graph that only ever
+	loses edges or gains vertices, as in the divisive algorithms. Components
+	are found once up front, and then kept up to date by asking, after every
+	removal, whether the removal split a component (see separated_side). The
+	side found to be cut off gets a new component id, so nothing is
+	recomputed over the whole graph.
+
+	membership[v] is the component id of v; ids run from 0 to len(self) - 1.
+	The graph itself is not kept, so that a Components can be stored on it
+	as an attribute and pickled along with it.
+	"""
+	def __init__(self, G):
+		self.refresh(G)
+
+
+	def refresh(self, G):
+		"""
+		Finds the components of G from scratch, which is cheaper than a
+		search per removal when a great many edges were removed at once.
+		"""
+		self.membership = list(G.components().membership)
+		self.sizes = [0] * (max(self.membership) + 1 if self.membership else 0)
+		for c in self.membership:
+			self.sizes[c] += 1
+
+
+	def __len__(self):
+		"""
+		Returns the number of connected components.
+		"""
+		return len(self.sizes)
+
+
+	def add_vertex(self, like=None):
+		"""
+		Records a vertex just added to the graph. It joins the component of
+		the vertex like, to which it is about to be connected, or gets a
+		component of its own if like is None.
+		"""
+		if like is None:
+			self.membership.append(len(self.sizes))
+			self.sizes.append(1)
+		else:
+			self.membership.append(self.membership[like])
+			self.sizes[self.membership[like]] += 1
+
+
+	def separated(self, G, u, v):
+		"""
+		Given vertices u and v of G, which were in the same component before
+		the last removal, returns True if they no longer are, and if so gives
+		the side that was cut off a component of its own.
+		"""
+		side = separated_side(G, u, v)
+		if side is None:
+			return False
+		old, new = self.membership[u], len(self.sizes)
+		for w in side:
+			self.membership[w] = new
+		self.sizes[old] -= len(side)
+		self.sizes.append(len(side))
+		return True
+
+
+class DisjointSets(object):
+	"""
+	A union-find structure over the integers 0 to n - 1, with path
+	compression and union by rank, so that any sequence of finds and unions
+	runs in near-linear time.
+	"""
+	def __init__(self, n):
+		self._parent = list(range(n))
+		self._rank = [0] * n
+
+
+	def __len__(self):
+		"""
+		Returns the number of elements, not of sets.
+		"""
+		return len(self._parent)
+
+
+	def add(self):
+		"""
+		Adds a new element in a set of its own, and returns it.
+		"""
+		self._parent.append(len(self._parent))
+		self._rank.append(0)
+		return len(self._parent) - 1
+
+
+	def find(self, x):
+		"""
+		Returns the representative of the set holding x.
+		"""
+		parent = self._parent
+		root = x
+		while parent[root] != root:
+			root = parent[root]
+		# point everything on the way straight at the root.
+		while parent[x] != root:
+			parent[x], x = root, parent[x]
+		return root
+
+
+	def union(self, x, y):
+		"""
+		Merges the sets holding x and y, and returns the representative of
+		the merged set.
+		"""
+		x, y = self.find(x), self.find(y)
+		if x == y:
+			return x
+		if self._rank[x] < self._rank[y]:
+			x, y = y, x
+		self._parent[y] = x
+		if self._rank[x] == self._rank[y]:
+			self._rank[x] += 1
+		return x
+
+
+def dendrogram_from_splits(G, splits):
+	"""
+	Given the edges [u, v] whose removal split G, in the order they were
+	removed, returns the VertexDendrogram of G that undoes them: the last
+	split is the first merge. Any divisive algorithm that logs its splits
+	gets its dendrogram this way in near-linear time.
+
+	As igraph expects, the cluster made by the i-th merge has id
+	G.vcount() + i. The clusters are tracked in a DisjointSets, along with
+	the id of the cluster each set currently stands for.
+	"""
+	n = G.vcount()
+	sets = DisjointSets(n)
+	label = list(range(n))
+	merges = []
+	for u, v in reversed(splits):
+		u, v = sets.find(u), sets.find(v)
+		merges.append([label[u], label[v]])
+		label[sets.union(u, v)] = n + len(merges) - 1
+	return ig.VertexDendrogram(G, merges)
@@ -0,0 +1,67 @@
+import circulo.algorithms.connectivity as connectivity
+import unittest
+import igraph
+
+
+class TestConnectivityFunctions(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Initializes the graph for testing to Zachary's
+        karate club.
+        """
+        self.graph = igraph.Graph.Famous("zachary")
+
+
+    def tearDown(self):
+        self.graph = None
+
+
+    def test_components(self):
+        """
+        Checks that components tracked through edge deletions and
+        vertex additions match those found by igraph.
+        """
+        G = self.graph.copy()
+        components = connectivity.Components(G)
+        G.add_vertex()
+        components.add_vertex()
+        # the same, searching neighbor sets kept up to date by hand.
+        neighbors = [set(G.neighbors(v)) for v in G.vs]
+        byHand = connectivity.Components(G)
+        for edge in [(0, 31), (0, 8), (2, 8), (13, 33), (19, 33), (2, 27), (2, 28), (2, 32)] + G.get_edgelist():
+            if G.get_eid(*edge, error=False) < 0:
+                continue
+            before = len(G.components())
+            G.delete_edges([edge])
+            neighbors[edge[0]].discard(edge[1]); neighbors[edge[1]].discard(edge[0])
+            self.assertEqual(components.separated(G, *edge), len(G.components()) > before)
+            self.assertEqual(byHand.separated(neighbors, *edge), len(G.components()) > before)
+            self.assertEqual(byHand.membership, components.membership)
+            theirs = G.components().membership
+            self.assertEqual(len(components), max(theirs) + 1)
+            # the two memberships must describe the same partition.
+            self.assertEqual(len(set(zip(components.membership, theirs))), len(components))
+            self.assertEqual([components.sizes[c] for c in components.membership],
+                             [theirs.count(c) for c in theirs])
+
+
+    def test_dendrogram_from_splits(self):
+        """
+        Checks the union-find and that the dendrogram undoes the splits.
+        """
+        sets = connectivity.DisjointSets(4)
+        sets.union(0, 1)
+        self.assertEqual(sets.find(0), sets.find(1))
+        self.assertNotEqual(sets.find(0), sets.find(2))
+        self.assertEqual(sets.add(), 4)
+
+        star = igraph.Graph.Star(5)
+        splits = [[0, i] for i in range(1, 5)]
+        dendrogram = connectivity.dendrogram_from_splits(star, splits)
+        self.assertEqual(dendrogram.merges, [(0, 4), (5, 3), (6, 2), (7, 1)])
+        self.assertEqual(dendrogram.as_clustering(2).membership, [0, 1, 0, 0, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,11 +2,31 @@ import igraph as ig
 import operator
 import sys
 
+from circulo.algorithms.betweenness import Sampler, component_betweenness
+from circulo.algorithms.connectivity import dendrogram_from_splits, separated
+from circulo.algorithms.checkpoint import checkpointer, run_key
 
-def gn(origGraph):
+
+def gn(origGraph, checkpoint=None, checkpoint_interval=600, local=True, batch=1, tolerance=0.0,
+		epsilon=None, seed=None):
 	"""
 	Parameters:
 		origGraph: a graph in igraph format
+		checkpoint: optional path to which progress is saved every
+			checkpoint_interval seconds. A run on the same graph resumes
+			from the last save, and the file is deleted when the run ends.
+		local: if True, after a removal only the component that lost the
+			edge has its betweennesses recalculated, since no other can
+			change. If False, the whole graph is recalculated every time.
+		batch: the most edges removed per recalculation. Past the edge with
+			the highest betweenness, an edge is only removed in the same
+			batch if its betweenness is within tolerance of the highest.
+		tolerance: relative tolerance for batch, so that an edge is removed
+			along with the first when eb >= (1 - tolerance) * max eb.
+		epsilon: if given, edge betweennesses are estimated from a sample of
+			source vertices large enough that the largest has a relative
+			standard error of about epsilon (see betweenness.Sampler).
+		seed: seeds the sampling, for reproducible estimates.
 
 	Return value:
 		A dendrogram (VertexDendrogram) created by running Girvan-Newman
@@ -14,31 +34,52 @@ def gn(origGraph):
 	Notes: 
 		Runs the Girvan-Newman (edge-betweenness) algorithm on the graph provided.
 		Iteratively removes the edge with the highest edge-betweenness, then recalculates.
+		With the default batch=1 the result is exact; a larger batch trades
+		exactness for fewer recalculations, since removing one edge can change
+		the betweenness of the others in its batch.
 	"""
 	
-	# initialize a list of removed edges that result in a split of the graph
-	splits = []
+	cp = checkpointer(checkpoint, run_key('gn', origGraph, local, batch, tolerance, epsilon, seed), checkpoint_interval)
+	state = cp.load() if cp is not None else None
+	if state is not None:
+		G, splits, sampler = state
+	else:
+		# initialize a list of removed edges that result in a split of the graph
+		splits = []
+
+		G = origGraph.copy() 
+
+		sampler = Sampler(epsilon, seed) if epsilon is not None else None
 
-	G = origGraph.copy() 
+		# Calculate all edge betweennesses once. After that, only the component
+		# that lost an edge can change, so only it is recalculated.
+		recalculate(G, sampler)
 
 	while G.es:
 
-		# Calculate all edge betweennesses
-		# TODO: only recalculate on relevant portions
-		edge_betweennesses = G.edge_betweenness()
+		edges = top_edges(G.es['eb'], batch, tolerance)
 
-		# returns an the first index if there is a tie at max.
-		max_index, _ = max(enumerate(edge_betweennesses), key=operator.itemgetter(1))
+		# edges with the max betweenness, as tuples since ids shift on deletion
+		edges = [G.es[index].tuple for index in edges]
 
-		# edge with the max betweenness
-		edge = G.es[max_index].tuple
+		for edge in edges:
+			G.delete_edges([edge])
 
-		G.delete_edges(edge)
+			if splitGraph(G, edge):
 
-		if splitGraph(G, edge):
+				# edge is a tuple, but we want a list of lists.
+				splits += [list(edge)]
 
-			# edge is a tuple, but we want a list of lists.
-			splits += [list(edge)]
+		if local:
+			component_betweenness(G, [v for edge in edges for v in edge], vertexAttr=None, sampler=sampler)
+		elif G.es:
+			recalculate(G, sampler)
+
+		if cp is not None and cp.due():
+			cp.save((G, splits, sampler))
+
+	if cp is not None:
+		cp.remove()
 
 	vd = createDendrogram(origGraph, splits)
 
@@ -48,6 +89,33 @@ def gn(origGraph):
 	return vd
 
 
+def recalculate(G, sampler=None):
+	"""
+	Calculates the edge betweenness of the whole of G, estimating it with
+	sampler if one is given.
+	"""
+	if sampler is None:
+		G.es['eb'] = G.edge_betweenness()
+	else:
+		component_betweenness(G, range(G.vcount()), vertexAttr=None, sampler=sampler)
+
+
+def top_edges(ebs, batch=1, tolerance=0.0):
+	"""
+	Returns the indices of the edges to remove next, given their
+	betweennesses ebs: the first edge with the max betweenness, then up to
+	batch - 1 more in decreasing order of betweenness whose betweenness is
+	at least (1 - tolerance) times the max. Ties go to the lowest index.
+	"""
+	# returns an the first index if there is a tie at max.
+	max_index, max_eb = max(enumerate(ebs), key=operator.itemgetter(1))
+	if batch <= 1:
+		return [max_index]
+	close = [i for i, eb in enumerate(ebs) if eb >= (1 - tolerance) * max_eb]
+	close.sort(key=lambda i: (-ebs[i], i))
+	return close[:batch]
+
+
 def splitGraph(G, edge):
 	""" 
 	Parameters:
@@ -59,10 +127,11 @@ def splitGraph(G, edge):
 	
 	Notes:
 		Checks to see if removing edge from G splits the graph into 2 disjoint
-	communities. If so, returns True, otherwise False.
+	communities. If so, returns True, otherwise False. Searches out from both
+	ends of the edge at once, and stops as soon as they meet.
 	"""
 
-	return not G.edge_disjoint_paths(source=edge[0], target=edge[1])
+	return separated(G, edge[0], edge[1])
 
 
 def createDendrogram(G, splits):
@@ -70,44 +139,12 @@ def createDendrogram(G, splits):
 	Given a historical list of split edges, creates a dendrogram 
 	by calculating the merges. 
 
-	Runs in O(nlgn) (But really, close to O(n).) This is a useful function
+	Runs in near-linear time, with a union-find of the clusters (see
+	connectivity.dendrogram_from_splits). This is a useful function
 	for any divisive algorithm for which splits can be saved more easily
 	than merges.
 	"""
-
-	# To create a dendrogram, new merges have id of max id + 1
-	n = len(splits) + 1
-	merges = []
-
-	mergeDict = {}
-
-	while splits:
-		# most recent split popped off
-		edge = splits.pop()
-
-		# Get the values the dendrogram wants for each vertex by finding
-		# where merges have already happened.
-		edge = [traverse(vertex, mergeDict) for vertex in edge]
-
-		merges += [edge]
-
-		# Update the dict to reflect a new merge.
-		for vertex in edge:
-			mergeDict[vertex] = n
-		
-		n += 1
-
-	return ig.VertexDendrogram(G, merges)
-
-
-def traverse(vertex, mergeDict):
-	"""
-	Given a vertex and a dictionaty of merges, returns the id of the cluster
-	the vertex belongs to.
-	"""
-	while vertex in mergeDict:
-		vertex = mergeDict[vertex]
-	return vertex
+	return dendrogram_from_splits(G, splits)
 
 
 
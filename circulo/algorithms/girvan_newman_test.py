@@ -0,0 +1,117 @@
+import circulo.algorithms.girvan_newman as GN
+import unittest
+import os
+import tempfile
+import random
+import igraph
+
+
+class TestGirvanNewmanFunctions(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Initializes the graph for testing to Zachary's
+        karate club.
+        """
+        self.graph = igraph.Graph.Famous("zachary")
+        self.batches = []
+        self.top_edges = GN.top_edges
+
+
+    def tearDown(self):
+        GN.top_edges = self.top_edges
+        self.graph = None
+
+
+    def record_batches(self):
+        """
+        Wraps top_edges so that every batch gn removes is kept in
+        self.batches, along with the betweennesses it was chosen from.
+        """
+        def recorded(ebs, batch=1, tolerance=0.0):
+            edges = self.top_edges(ebs, batch, tolerance)
+            self.batches.append(([ebs[i] for i in edges], max(ebs)))
+            return edges
+        GN.top_edges = recorded
+
+
+    def test_local(self):
+        """
+        Checks that recalculating only the component that lost an edge
+        gives the same dendrogram as recalculating the whole graph.
+        """
+        random.seed(41)
+        graphs = [self.graph, igraph.Graph.Erdos_Renyi(60, m=150),
+                  self.graph + igraph.Graph.Famous("Krackhardt_Kite")]
+        for G in graphs:
+            self.assertEqual(GN.gn(G, local=False).merges, GN.gn(G).merges)
+
+
+    def test_top_edges(self):
+        """
+        Checks that a batch holds only edges within tolerance of the max,
+        in decreasing order of betweenness, ties to the lowest index.
+        """
+        ebs = [10., 9.5, 8., 10., 9.5]
+        self.assertEqual(GN.top_edges(ebs), [0])
+        self.assertEqual(GN.top_edges(ebs, batch=3), [0, 3])
+        self.assertEqual(GN.top_edges(ebs, batch=3, tolerance=0.1), [0, 3, 1])
+        self.assertEqual(GN.top_edges(ebs, batch=5, tolerance=0.1), [0, 3, 1, 4])
+
+
+    def test_batch_ties(self):
+        """
+        Checks that with no tolerance a batch of two only ever removes
+        edges tied at the max betweenness.
+        """
+        self.record_batches()
+        GN.gn(self.graph, batch=2, tolerance=0)
+        self.assertTrue(any(len(ebs) == 2 for ebs, _ in self.batches))
+        for ebs, maxEb in self.batches:
+            self.assertLessEqual(len(ebs), 2)
+            self.assertEqual(ebs, [maxEb] * len(ebs))
+
+
+    def test_batch_tolerance(self):
+        """
+        Checks that with a tolerance a batch also takes edges below the
+        max betweenness, but none outside the tolerance band.
+        """
+        self.record_batches()
+        GN.gn(self.graph, batch=3, tolerance=0.1)
+        self.assertTrue(any(min(ebs) < maxEb for ebs, maxEb in self.batches))
+        for ebs, maxEb in self.batches:
+            self.assertLessEqual(len(ebs), 3)
+            self.assertTrue(all(eb >= 0.9 * maxEb for eb in ebs))
+            self.assertEqual(ebs, sorted(ebs, reverse=True))
+
+
+    def test_checkpoint(self):
+        """
+        Checks that a run killed part way through resumes from its
+        checkpoint and finds the same dendrogram as an uninterrupted run,
+        with local and whole-graph recalculation.
+        """
+        for local in (True, False):
+            expected = GN.gn(self.graph, local=local)
+            path = os.path.join(tempfile.mkdtemp(), 'gn.ckpt')
+            splitGraph, calls = GN.splitGraph, []
+            def crash(*args):
+                calls.append(args)
+                if len(calls) == 40:
+                    raise KeyboardInterrupt
+                return splitGraph(*args)
+            GN.splitGraph = crash
+            try:
+                self.assertRaises(KeyboardInterrupt, GN.gn, self.graph, checkpoint=path,
+                                  checkpoint_interval=0, local=local)
+            finally:
+                GN.splitGraph = splitGraph
+            self.assertTrue(os.path.exists(path))
+            result = GN.gn(self.graph, checkpoint=path, local=local)
+            self.assertFalse(os.path.exists(path))
+            self.assertEqual(result.merges, expected.merges)
+
+
+if __name__ == '__main__':
+    unittest.main()
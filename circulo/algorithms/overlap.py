@@ -1,15 +1,67 @@
 import igraph as ig
+import itertools
+import multiprocessing
+import numpy as np
 import operator
-from collections import defaultdict
+import scipy.sparse
+import scipy.sparse.csgraph
+from collections import defaultdict, OrderedDict
 from time import sleep
 
+from circulo.algorithms.betweenness import expand_ranges
+
+# How close, relative to the best, the modularity of a cover scored by a sweep
+# must come for it to be scored again from scratch before the best is chosen.
+SWEEP_TOLERANCE = 1e-9
+
 
 #############################
 # Fuzzy Modularity Measures #
 #############################
 
+class NepuszModularity(object):
+    """
+    The fuzzy modularity of Nepusz et al., as used by CONGA 2010, of fuzzy
+    covers of one graph:
+
+        Q = 1/2m sum_ij (A_ij - k_i k_j / 2m) s_ij
+
+    where s_ij = sum_c u_ic u_jc is the similarity of the membership
+    degrees of i and j. With U the n x k matrix of membership degrees the
+    double sum is never formed: sum_ij A_ij s_ij is the sum of the entries
+    of U * (AU), and sum_ij k_i k_j s_ij is the squared norm of U'k. U may
+    be a dense array or a scipy sparse matrix. The adjacency and strengths
+    are found once per graph and reused for every cover.
+    """
+    def __init__(self, G):
+        self._adjacency = adjacency_matrix(G)
+        self._strength = np.asarray(self._adjacency.sum(axis=1)).ravel()
+        self._graph = G
+
+
+    def __call__(self, membership):
+        """
+        Returns the modularity of the fuzzy cover with the given n x k matrix
+        of membership degrees.
+        """
+        twoM = self._strength.sum()
+        if not twoM:
+            return 0.0
+        inner = self._adjacency.dot(membership)
+        if scipy.sparse.issparse(membership):
+            internal = membership.multiply(inner).sum()
+        else:
+            internal = np.multiply(membership, inner).sum()
+        expected = np.square(np.asarray(membership.T.dot(self._strength)).ravel()).sum() / twoM
+        return float((internal - expected) / twoM)
+
+
 def nepusz_modularity(G, cover):
-    raise NotImplementedError("See the CONGA 2010 paper")
+    """
+    Returns the Nepusz modularity of cover, an n x k matrix of the
+    membership degrees of the vertices of G. See NepuszModularity.
+    """
+    return NepuszModularity(G)(cover)
 
 def zhang_modularity(G, cover):
     raise NotImplementedError("""See 'Identification of overlapping community structure in
@@ -24,6 +76,21 @@ def nicosia_modularity(G, cover):
 # Crisp modularity measures #
 #############################
 
+def membership_matrix(G, cover):
+    """
+    Returns the sparse n x k incidence matrix of cover, a list of
+    communities of the vertices of G: entry (v, c) is 1 if v is in the
+    c-th community, else 0. A vertex listed twice in a community, as both
+    copies of a vertex split by CONGA can be, is in it once.
+    """
+    rows = [v for community in cover for v in community]
+    cols = [c for c, community in enumerate(cover) for v in community]
+    membership = scipy.sparse.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                                         shape=(G.vcount(), len(cover)))
+    membership.data[:] = 1
+    return membership
+
+
 def count_communities(G, cover):
     """
     Helper for lazar_modularity.
@@ -32,11 +99,8 @@ def count_communities(G, cover):
     count is the number of different communities it is
     assigned to.
     """
-    counts = {i.index : 0 for i in G.vs}
-    for community in cover:
-        for v in community:
-            counts[v] += 1
-    return counts
+    counts = np.asarray(membership_matrix(G, cover).sum(axis=1)).ravel()
+    return dict(enumerate(counts.astype(int).tolist()))
 
 
 def get_weights(G):
@@ -53,11 +117,39 @@ def get_weights(G):
     return weights
 
 
+def adjacency_matrix(G):
+    """
+    Returns the sparse symmetric n x n weighted adjacency matrix of the
+    undirected graph G. Parallel edges add up.
+    """
+    weights = np.asarray(get_weights(G), dtype=float)
+    edges = np.array(G.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    n = G.vcount()
+    return scipy.sparse.csr_matrix(
+            (np.concatenate((weights, weights)),
+             (np.concatenate((edges[:, 0], edges[:, 1])), np.concatenate((edges[:, 1], edges[:, 0])))),
+            shape=(n, n))
+
+
+def fuzzy_membership(G, cover):
+    """
+    Returns the sparse n x k matrix of membership degrees of the fuzzy cover
+    made from cover, a crisp list of possibly overlapping communities of the
+    vertices of G, as in CONGA 2010: a vertex in s communities belongs to
+    each with degree 1/s. A vertex in no community has a row of zeros.
+    """
+    membership = membership_matrix(G, cover)
+    counts = np.asarray(membership.sum(axis=1)).ravel()
+    scale = np.divide(1.0, counts, out=np.zeros(len(counts)), where=counts > 0)
+    return scipy.sparse.diags(scale).dot(membership).tocsr()
+
+
 def get_single_lazar_modularity(G, community, weights, counts):
     """
     Returns the lazar modularity of a single community.
     """
-    totalInternalWeight = sum(weights[G.es[e].index] for e in community) # m_c in paper
+    community = sorted(set(community))
+    totalInternalWeight = sum(weights[e] for e in G.es.select(_within=community).indices) # m_c in paper
     numVerticesInCommunity = len(community) # V_c in paper
     numPossibleInternalEdges = numVerticesInCommunity * (numVerticesInCommunity - 1) / 2
     if numPossibleInternalEdges == 0: return 0
@@ -80,6 +172,220 @@ def get_single_lazar_modularity(G, community, weights, counts):
     return edgeDensity * interVsIntra
 
 
+class LazarModularity(object):
+    """
+    The Lazar modularity of covers of one graph, computed with sparse
+    matrix products rather than a walk over every vertex's neighbors.
+
+    With B the n x k membership matrix of a cover and A the weighted
+    adjacency, (AB)[v, c] is the weight from v into community c. From it
+    come every community's internal weight (m_c), the inter vs intra term
+    of each of its vertices, and with the row sums of B the number of
+    communities each vertex is in (s_i). The adjacency, strengths and
+    degrees are found once per graph and reused for every cover.
+    """
+    def __init__(self, G):
+        self._adjacency = adjacency_matrix(G)
+        self._strength = np.asarray(self._adjacency.sum(axis=1)).ravel()
+        self._degree = np.array(G.degree(), dtype=float)
+        self._graph = G
+
+
+    def community_modularities(self, membership):
+        """
+        Given the sparse membership matrix of a cover, returns an array of
+        the modularity of each of its communities.
+        """
+        membership = scipy.sparse.csr_matrix(membership)
+        counts = np.asarray(membership.sum(axis=1)).ravel() # s_i in paper
+        sizes = np.asarray(membership.sum(axis=0)).ravel() # V_c in paper
+        # weight from every member of a community into that community
+        inward = membership.multiply(self._adjacency.dot(membership)).tocoo()
+        internalWeight = np.bincount(inward.col, weights=inward.data, minlength=len(sizes)) / 2 # m_c in paper
+
+        # every member v of c adds (w(v, c) - w(v, not c)) / (k_v s_v)
+        members = membership.tocoo()
+        scale = self._degree[members.row] * counts[members.row]
+        scale[scale == 0] = np.inf
+        fromMembers = -self._strength[members.row] / scale
+        interVsIntra = np.bincount(members.col, weights=fromMembers, minlength=len(sizes))
+        interVsIntra += np.bincount(inward.col, weights=2 * inward.data / (self._degree[inward.row] * counts[inward.row]),
+                                    minlength=len(sizes))
+
+        numPossibleInternalEdges = sizes * (sizes - 1) / 2
+        modularities = np.zeros(len(sizes))
+        big = numPossibleInternalEdges > 0
+        modularities[big] = internalWeight[big] / numPossibleInternalEdges[big] / sizes[big] * interVsIntra[big]
+        return modularities
+
+
+    def __call__(self, cover):
+        """
+        Returns the Lazar modularity of cover.
+        """
+        return self.community_modularities(membership_matrix(self._graph, cover)).mean()
+
+
+    def sweep(self, clusters, merges):
+        """
+        Yields the Lazar modularity of the cover with the given clusters, a
+        dict of lists of distinct vertex ids keyed by label, and then of each
+        cover made from the one before by a step of merges, a list of pairs of
+        labels (x, y) meaning that cluster y joins cluster x. See
+        SplitLog.walk_back, which gives both for the covers of CONGA and CONGO.
+
+        A step walks the neighbors of the vertices that the smaller of each
+        pair brings to the larger, and the communities of the vertices that
+        were in both, whose number of communities drops. Nothing else is
+        touched, however large the communities are.
+        """
+        state = _LazarState(self, clusters)
+        yield state.total / len(state.communities)
+        for step in merges:
+            for x, y in step:
+                state.merge(x, y)
+            yield state.total / len(state.communities)
+
+
+    def _score(self, members):
+        """
+        Returns (density, inward) for the community of the given members,
+        an array of vertex ids, where inward is the weight from each member
+        into the community.
+        """
+        # walk the adjacency rows of the members, keeping the entries that
+        # point back into the community.
+        A = self._adjacency
+        inside = np.zeros(A.shape[0], dtype=bool)
+        inside[members] = True
+        starts = A.indptr[members]
+        lengths = A.indptr[members + 1] - starts
+        entries = expand_ranges(starts, lengths)
+        kept = inside[A.indices[entries]]
+        inward = np.bincount(np.repeat(np.arange(len(members)), lengths)[kept],
+                             weights=A.data[entries[kept]], minlength=len(members))
+        size = len(members)
+        numPossibleInternalEdges = size * (size - 1) / 2
+        if numPossibleInternalEdges == 0:
+            return 0., inward
+        return inward.sum() / 2 / numPossibleInternalEdges / size, inward
+
+
+class _LazarCommunity(object):
+    """
+    One community of a _LazarState: the weight from each member into it,
+    their sum (twice m_c), the sum of the inter vs intra terms of its
+    members, and its modularity, their product with its density.
+    """
+    def __init__(self, inward):
+        self.inward = inward
+        self.internal = sum(inward.values())
+        self.terms = 0.
+        self.modularity = 0.
+
+
+class _LazarState(object):
+    """
+    The Lazar terms of the communities of one cover, for LazarModularity.sweep.
+    """
+    def __init__(self, measure, clusters):
+        A = measure._adjacency
+        self._indptr, self._indices, self._data = A.indptr.tolist(), A.indices.tolist(), A.data.tolist()
+        self._strength = measure._strength.tolist()
+        self._invDegree = [1. / d if d else 0. for d in measure._degree.tolist()]
+        self.counts = [0] * len(self._strength) # s_i in paper
+        # the communities each vertex is in, in the order it joined them,
+        # so that sums are always taken in the same order.
+        self.containing = defaultdict(dict)
+        self.communities = {}
+        self.total = 0.
+        for community in clusters.values():
+            for v in community:
+                self.counts[v] += 1
+        for label, community in clusters.items():
+            members = np.array(community, dtype=np.int64)
+            _, inward = measure._score(members)
+            c = _LazarCommunity(dict(zip(members.tolist(), inward.tolist())))
+            c.terms = sum(self._term(v, w) for v, w in c.inward.items())
+            self.communities[label] = c
+            for v in c.inward:
+                self.containing[v][c] = None
+            self._rescore(c)
+
+
+    def _term(self, v, inward):
+        """
+        Returns the inter vs intra term of v in a community into which it
+        has the given weight.
+        """
+        return (2 * inward - self._strength[v]) * self._invDegree[v] / self.counts[v]
+
+
+    def _rescore(self, c):
+        """
+        Brings the modularity of c, and the total, up to date with its sums.
+        """
+        size = len(c.inward)
+        self.total -= c.modularity
+        c.modularity = c.internal / (size * (size - 1) * size) * c.terms if size > 1 else 0.
+        self.total += c.modularity
+
+
+    def merge(self, x, y):
+        """
+        Moves on to the cover in which the community labelled y has joined
+        the one labelled x.
+        """
+        big, small = self.communities[x], self.communities.pop(y)
+        if len(big.inward) < len(small.inward):
+            big, small = small, big
+            self.communities[x] = big
+        self.total -= small.modularity
+        joined = []
+        for v in small.inward:
+            del self.containing[v][small]
+            if v in big.inward:
+                self._recount(v)
+            else:
+                joined.append(v)
+        for u in joined:
+            self._join(big, u)
+        self._rescore(big)
+
+
+    def _recount(self, v):
+        """
+        Takes one from the number of communities of v, updating the terms of
+        the communities it is in.
+        """
+        old = self.counts[v]
+        self.counts[v] -= 1
+        for c in self.containing[v]:
+            c.terms += self._term(v, c.inward[v]) * (1 - self.counts[v] / old)
+            self._rescore(c)
+
+
+    def _join(self, c, u):
+        """
+        Adds u to c. Each edge from u to a member already added adds its
+        weight to the inward weights of both ends.
+        """
+        inward = 0.
+        for i in range(self._indptr[u], self._indptr[u + 1]):
+            w, weight = self._indices[i], self._data[i]
+            if w == u:
+                inward += weight
+                c.internal += weight
+            elif w in c.inward:
+                inward += weight
+                c.inward[w] += weight
+                c.internal += 2 * weight
+                c.terms += 2 * weight * self._invDegree[w] / self.counts[w]
+        c.inward[u] = inward
+        c.terms += self._term(u, inward)
+        self.containing[u][c] = None
+
+
 def lazar_modularity(G, cover):
     """
     Returns the crisp modularity measure as defined by Lazar et al. 2009
@@ -89,94 +395,267 @@ def lazar_modularity(G, cover):
 
     See CONGA 2010 or Lazar's paper for a precise definition.
     """
-    numCommunities = len(cover) # |C| in the paper
-    totalModularity = 0 # M_c in the paper
-    weights = get_weights(G)
-    counts = count_communities(G, cover)
-    for c in cover:
-        totalModularity += get_single_lazar_modularity(G, c, weights, counts)
-    averageModularity = 1/numCommunities * totalModularity #  M in the paper
-    return averageModularity
+    return LazarModularity(G)(cover)
 
 
 ##################################
 # Classes for overlapping covers #
 ##################################
 
+class SplitLog(object):
+    """
+    A compact, ordered record of the splits made by a divisive overlapping
+    algorithm such as CONGA or CONGO, from which the cover at any number of
+    clusters can be rebuilt.
+
+    The algorithms only ever add vertices (copies made by vertex splits) and
+    remove edges, so the working graph never becomes more connected. Going
+    back from the components of the final working graph, every split joins
+    the two vertices it separated and every copy rejoins the vertex it was
+    split off from. Only those pairs, the final membership and the provenance
+    of each copy are stored, so memory is linear in the number of operations.
+    """
+    def __init__(self, numVertices, numClusters):
+        """
+        Starts a log for a working graph of numVertices vertices that is
+        initially split into numClusters connected components.
+        """
+        self._numVertices = numVertices
+        self._initialCount = numClusters
+        self._splits = []
+        self._vcounts = []
+        self._orig = None
+        self._parent = None
+        self._membership = None
+
+
+    def add_split(self, a, b, vcount):
+        """
+        Records that the last modification disconnected the vertices a and b
+        of the working graph, which had vcount vertices at the time.
+        """
+        self._splits.append((a, b))
+        self._vcounts.append(vcount)
+
+
+    def finish(self, orig, parent, membership=None):
+        """
+        Stores the provenance of the final working graph: orig[v] is the id
+        of v in the original graph and parent[v] the vertex v was copied
+        from, or None for vertices of the original graph. membership gives
+        the final connected components, and may be left out if no edges are
+        left.
+        """
+        if membership is None:
+            membership = range(len(orig))
+        self._membership = np.array(membership, dtype=np.int64)
+        self._orig = np.array(orig, dtype=np.int64)
+        self._parent = np.array([-1 if p is None else p for p in parent], dtype=np.int64)
+        self._splits = np.array(self._splits, dtype=np.int64).reshape(-1, 2)
+        self._vcounts = np.array(self._vcounts, dtype=np.int64)
+
+
+    def counts(self):
+        """
+        Returns the numbers of clusters that a cover can be rebuilt for.
+        """
+        return range(self._initialCount, self._initialCount + len(self._splits) + 1)
+
+
+    def _vcount(self, done):
+        """
+        Returns the number of vertices of the working graph after the given
+        number of splits.
+        """
+        return self._vcounts[done - 1] if done else self._numVertices
+
+
+    def _labels(self, numClusters):
+        """
+        Returns the number of vertices of the working graph when it had the
+        given number of clusters, and a list of the label of the cluster of
+        each vertex of the final working graph at that time.
+        """
+        if numClusters not in self.counts():
+            raise KeyError(numClusters)
+        done = numClusters - self._initialCount
+        vcount = self._vcount(done)
+
+        # start from the final components, then undo every later split
+        # and every later vertex copy.
+        size = len(self._parent)
+        later = np.arange(vcount, size)
+        tails = np.concatenate((self._splits[done:, 0], later, np.arange(size)))
+        heads = np.concatenate((self._splits[done:, 1], self._parent[later], size + self._membership))
+        joins = scipy.sparse.coo_matrix((np.ones(len(tails)), (tails, heads)),
+                                        shape=(2 * size, 2 * size))
+        _, labels = scipy.sparse.csgraph.connected_components(joins, directed=False)
+        return vcount, labels[:size].tolist()
+
+
+    def cover(self, graph, numClusters):
+        """
+        Rebuilds the cover of graph, the original graph, with the given
+        number of clusters.
+        """
+        vcount, labels = self._labels(numClusters)
+
+        # list the clusters, and their members, in the order of the vertices
+        # that existed at the time, as G.components() would have.
+        clusters = OrderedDict()
+        for v in range(vcount):
+            clusters.setdefault(labels[v], []).append(int(self._orig[v]))
+        return ig.VertexCover(graph, clusters=list(clusters.values()))
+
+
+    def walk_back(self, numClusters, stop):
+        """
+        Returns the clusters of the cover with numClusters clusters, as a dict
+        {l : c} where l is a label and c a list of the distinct vertex ids of
+        the original graph in the cluster, and an iterator over the steps back
+        to the cover with stop clusters, one for each number of clusters in
+        between. A step is a list of pairs of labels (x, y), each meaning that
+        cluster y joins cluster x, which keeps its label.
+
+        Copies of a vertex always share its id in the original graph, so a
+        step never takes a vertex out of a cluster: it only merges clusters.
+        """
+        vcount, labels = self._labels(numClusters)
+        clusters = defaultdict(set)
+        for v in range(vcount):
+            clusters[labels[v]].add(int(self._orig[v]))
+        return {l : list(c) for l, c in clusters.items()}, self._merges(numClusters, stop, labels)
+
+
+    def _merges(self, numClusters, stop, labels):
+        """
+        Yields the steps of walk_back, given the labels of the vertices of the
+        final working graph in the cover with numClusters clusters.
+        """
+        roots = {}
+        def find(x):
+            path = []
+            while x in roots:
+                path.append(x)
+                x = roots[x]
+            for label in path:
+                roots[label] = x
+            return x
+
+        # undoing a split joins the two vertices it separated, and every
+        # vertex copied since the split before rejoins its parent.
+        for done in range(numClusters - self._initialCount, stop - self._initialCount, -1):
+            joins = [tuple(self._splits[done - 1].tolist())]
+            joins += [(v, int(self._parent[v])) for v in range(self._vcount(done - 1), self._vcount(done))]
+            step = []
+            for a, b in joins:
+                x, y = find(labels[a]), find(labels[b])
+                if x != y:
+                    roots[y] = x
+                    step.append((x, y))
+            yield step
+
+
 class CrispOverlap(object):
     """
     TODO
     """
-    def __init__(self, graph, covers, modularities=None, optimal_count=None, modularity_measure="lazar"):
+    def __init__(self, graph, covers, modularities=None, optimal_count=None, modularity_measure="lazar", cache_size=16,
+                 workers=None):
         """
         Initializes a CrispOverlap object with the given parameters.
 
             Graph: The graph to which the object refers
             covers: a dict of VertexCovers, also referring to this graph, of the form {k : v}
-                where k is the number of clusters and v is the vertexCluste
+                where k is the number of clusters and v is the vertexCluste, or a
+                SplitLog from which the covers are rebuilt when needed.
             modularities (optional): a dict of modularities of the form {c:m} where c is
                 the number of clusters and m is the modularity.
             optimal_count (optional): A hint for the number of clusters to use.
             modularity_measure (optional): The name of the modularity function to use.
                 Right now, the only choice is "lazar."
+            cache_size (optional): How many covers rebuilt from a SplitLog to keep.
+            workers (optional): How many processes score the covers when the
+                modularities are first needed. See recalculate_modularities.
         """
-        # Possibly figure out a better data structure like a merge
-        # list that contains all information needed?
-
-        # So far only know of Lazar's measure for crisp overlapping.
-        self._measureDict = {"lazar" : lazar_modularity}
+        # So far only know of Lazar's measure for crisp overlapping. Each
+        # measure is made once per graph, then called on every cover.
+        self._measureDict = {"lazar" : LazarModularity}
         self._covers = covers
         self._graph = graph
         self._optimal_count = optimal_count
         self._modularities = modularities
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._workers = workers
         if modularity_measure in self._measureDict:
             self._modularity_measure = modularity_measure
         else: raise KeyError("Modularity measure not found.")
 
 
+    def _counts(self):
+        """
+        Returns the numbers of clusters of the covers in the object.
+        """
+        if isinstance(self._covers, SplitLog):
+            return self._covers.counts()
+        return list(self._covers.keys())
+
+
     def __getitem__(self, numClusters):
         """
         Returns the cover with the given number of clusters.
         """
         if not numClusters:
             raise KeyError("Number of clusters must be a positive integer.")
-        return self._covers[numClusters]
+        if not isinstance(self._covers, SplitLog):
+            return self._covers[numClusters]
+
+        # keep the most recently used covers around.
+        if numClusters in self._cache:
+            self._cache.move_to_end(numClusters)
+            return self._cache[numClusters]
+        cover = self._covers.cover(self._graph, numClusters)
+        self._cache[numClusters] = cover
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return cover
 
     def __iter__(self):
         """
         Iterates over the covers in the list.
         """
-        return (v for v in list(self._covers.values()))
+        return (self[k] for k in self._counts())
 
 
     def __len__(self):
         """
         Returns the number of covers in the list.
         """
-        return len(self._covers)
+        return len(self._counts())
 
     def __bool__(self):
         """
         Returns True when there is at least one cover in the list.
         """
-        return bool(self._covers)
+        return len(self) > 0
 
 
     def __str__(self):
         """
         Returns a string representation of the list of covers.
         """
-        return '{0} vertices in {1} possible covers.'.format(len(self._graph.vs), len(self._covers))
+        return '{0} vertices in {1} possible covers.'.format(len(self._graph.vs), len(self))
 
 
     def as_cover(self):
         """
         Returns the optimal cover (by modularity) from the object.
         """
-        return self._covers[self.optimal_count]
+        return self[self.optimal_count]
 
 
-    def change_modularity_measure(measure, recalculate=True):
+    def change_modularity_measure(self, measure, recalculate=True):
         """
         Given measure, the name of a new modularity measure, switches
         the modularity function used. If recalculate=True, also recalculates
@@ -190,13 +669,49 @@ class CrispOverlap(object):
         if recalculate:
             self.recalculate_modularities()
 
-    def recalculate_modularities(self):
+    def recalculate_modularities(self, incremental=True, workers=None):
         """
         Recalculates the modularities and optimal count using the modularity_measure.
+
+        If incremental is True and the covers come from a SplitLog, only the cover
+        with the most clusters is scored from scratch. The others are scored by
+        walking back through the splits, each merging two communities of the cover
+        after it (see LazarModularity.sweep). Otherwise each cover is scored from
+        scratch.
+
+        A sweep keeps a running total that drifts by rounding, which could tip the
+        choice of the optimal count between covers of near equal modularity. So the
+        covers within SWEEP_TOLERANCE of the best are scored again from scratch, and
+        the optimal count is the one incremental=False would choose.
+
+        If workers is greater than 1, the covers are split into runs of consecutive
+        counts and scored by that many processes. Each process is sent the graph
+        and the covers (just the SplitLog, if that is what they come from) once.
         """
-        modDict = {}
-        for cover in self._covers.values():
-            modDict[len(cover)] = self._measureDict[self._modularity_measure](self._graph, cover)
+        counts = sorted(self._counts())
+        if workers is not None and workers > 1 and len(counts) > 1:
+            covers = self._covers
+            if not isinstance(covers, SplitLog):
+                covers = {k : [list(community) for community in self[k]] for k in counts}
+            runs = [list(run) for run in np.array_split(counts, min(4 * workers, len(counts)))]
+            with multiprocessing.Pool(workers, initializer=_init_sweep,
+                    initargs=(self._graph, covers, self._measureDict[self._modularity_measure])) as pool:
+                modularities = itertools.chain.from_iterable(
+                    pool.map(_sweep_run, [(run, incremental) for run in runs]))
+                modDict = dict(zip(counts, modularities))
+        else:
+            measure = self._measureDict[self._modularity_measure](self._graph)
+            if incremental and isinstance(self._covers, SplitLog) and counts:
+                modularities = list(measure.sweep(*self._covers.walk_back(counts[-1], counts[0])))
+                modDict = dict(zip(counts, reversed(modularities)))
+            else:
+                modDict = {k : measure(self[k]) for k in counts}
+        if incremental and isinstance(self._covers, SplitLog) and modDict:
+            measure = self._measureDict[self._modularity_measure](self._graph)
+            best = max(modDict.values())
+            for k in counts:
+                if modDict[k] >= best - SWEEP_TOLERANCE * max(abs(best), 1.):
+                    modDict[k] = measure(self[k])
         self._modularities = modDict
         self._optimal_count = max(iter(self._modularities.items()), key=operator.itemgetter(1))[0]
         return self._modularities
@@ -214,7 +729,7 @@ class CrispOverlap(object):
         """
         if self._modularities:
             return self._modularities
-        self._modularities = self.recalculate_modularities()
+        self._modularities = self.recalculate_modularities(workers=self._workers)
         return self._modularities
 
 
@@ -242,7 +757,7 @@ class CrispOverlap(object):
         Takes a cover in vertex-id form and prints it nicely
         using label as each vertex's name.
         """
-        cover = self._covers[numClusters]
+        cover = self[numClusters]
         #if label == 'CONGA_index':
         pp = [self._graph.vs[num] for num in [cluster for cluster in cover]]
         #else: 
@@ -254,57 +769,204 @@ class CrispOverlap(object):
             print()
 
 
-    def make_fuzzy(self):
+    def make_fuzzy(self, modularity_measure="nepusz"):
         """
-        TODO. see CONGA 2010
+        Returns a FuzzyOverlap of the same covers, in which a vertex in s
+        communities of a cover belongs to each with degree 1/s (see CONGA
+        2010). The membership matrices are built from this object as they are
+        asked for, so nothing is copied up front.
         """
-        pass
+        return FuzzyOverlap(self._graph, self, modularity_measure=modularity_measure)
+
+
+
 
+# The graph, covers and modularity measure of a parallel
+# recalculate_modularities, set once in each worker process.
+_sweep = {}
 
 
+def _init_sweep(graph, covers, measure):
+    """
+    Pool initializer for CrispOverlap.recalculate_modularities.
+    """
+    _sweep['graph'] = graph
+    _sweep['covers'] = covers
+    _sweep['measure'] = measure(graph)
+
+
+def _sweep_run(args):
+    """
+    Returns the modularities of the covers with the given numbers of
+    clusters, scored in order in a worker process.
+    """
+    counts, incremental = args
+    graph, covers, measure = _sweep['graph'], _sweep['covers'], _sweep['measure']
+    if not isinstance(covers, SplitLog):
+        return [float(measure(covers[k])) for k in counts]
+    if incremental:
+        return [float(m) for m in measure.sweep(*covers.walk_back(int(counts[-1]), int(counts[0])))][::-1]
+    return [float(measure(covers.cover(graph, int(k)))) for k in counts]
+
 
-# TODO. Other algorithms like FOG return a fuzzy overlapping.
 
-# Nothing below this line has been implemented.
-###############################################
 
 class FuzzyOverlap(object):
     """
-    TODO
+    A list of fuzzy covers of a graph, one for each number of clusters. A
+    fuzzy cover is an n x k matrix of membership degrees, where entry (v, c)
+    is how strongly vertex v belongs to the c-th community; it may be a dense
+    array or a scipy sparse matrix. Algorithms like FOG return one directly,
+    and CrispOverlap.make_fuzzy turns crisp overlapping covers into them.
     """
-    def __init__(self, graph, coverDict, optimal_count=None, modularity_measure = "nepusz"):
+    def __init__(self, graph, covers, modularities=None, optimal_count=None, modularity_measure="nepusz"):
         """
-        TODO
+        Initializes a FuzzyOverlap object with the given parameters.
+
+            Graph: The graph to which the object refers
+            covers: a dict of membership matrices of the form {k : u} where k is
+                the number of clusters and u is the n x k matrix, or a CrispOverlap
+                whose covers are made fuzzy when needed (see fuzzy_membership).
+            modularities (optional): a dict of modularities of the form {c:m} where c is
+                the number of clusters and m is the modularity.
+            optimal_count (optional): A hint for the number of clusters to use.
+            modularity_measure (optional): The name of the modularity function to use.
+                Right now, the only choice is "nepusz."
         """
-        # this repeats a ton of data. figure out a better data structure.
-        self._coverDict = coverDict
+        # zhang and nicosia are not implemented yet.
+        self._measureDict = {"nepusz" : NepuszModularity}
+        self._covers = covers
         self._graph = graph
         self._optimal_count = optimal_count
-        if modularity_measure in modularityDict:
+        self._modularities = modularities
+        if modularity_measure in self._measureDict:
             self._modularity_measure = modularity_measure
         else: raise KeyError("Modularity measure not found.")
-        self._mod_flag = False
-        self.fuzzyDict = {"nepusz" : nepusz_modularity,
-                          "zhang": zhang_modularity,
-                          "nicosia" : nicosia_modularity}
 
 
-    @property
-    def optimal_count(self):
+    def _counts(self):
         """
-        TODO
+        Returns the numbers of clusters of the covers in the object.
         """
-        if self._optimal_count is not None and not mod_flag:
-            return self._optimal_count
-        else:
-            max_mod, max_index = max(enumerate(self.list_modularities))
-            mod_flag = False
-            return max_index + 1
+        if isinstance(self._covers, CrispOverlap):
+            return self._covers._counts()
+        return list(self._covers.keys())
+
+
+    def __getitem__(self, numClusters):
+        """
+        Returns the membership matrix of the cover with the given number of clusters.
+        """
+        if not numClusters:
+            raise KeyError("Number of clusters must be a positive integer.")
+        if isinstance(self._covers, CrispOverlap):
+            return fuzzy_membership(self._graph, self._covers[numClusters])
+        return self._covers[numClusters]
+
+
+    def __iter__(self):
+        """
+        Iterates over the membership matrices of the covers in the list.
+        """
+        return (self[k] for k in self._counts())
+
+
+    def __len__(self):
+        """
+        Returns the number of covers in the list.
+        """
+        return len(self._counts())
+
+
+    def __bool__(self):
+        """
+        Returns True when there is at least one cover in the list.
+        """
+        return len(self) > 0
+
+
+    def __str__(self):
+        """
+        Returns a string representation of the list of covers.
+        """
+        return '{0} vertices in {1} possible fuzzy covers.'.format(len(self._graph.vs), len(self))
+
 
+    def threshold(self, numClusters, threshold=0):
+        """
+        Returns the cover with the given number of clusters as a crisp
+        VertexCover, in which each community holds the vertices whose
+        membership degree in it is greater than threshold.
+        """
+        membership = scipy.sparse.csc_matrix(self[numClusters])
+        membership.eliminate_zeros()
+        return ig.VertexCover(self._graph,
+                [membership.indices[membership.indptr[c]:membership.indptr[c+1]][
+                    membership.data[membership.indptr[c]:membership.indptr[c+1]] > threshold].tolist()
+                 for c in range(membership.shape[1])])
 
 
-    def change_modularity_measure(self, new):
-        mod_flag = True
-        if new in modularityDict:
-            self._modularity_measure = new
+    def as_cover(self, threshold=0):
+        """
+        Returns the optimal cover (by modularity) from the object, made crisp
+        with the given threshold. See threshold.
+        """
+        return self.threshold(self.optimal_count, threshold)
+
+
+    def change_modularity_measure(self, measure, recalculate=True):
+        """
+        Given measure, the name of a new modularity measure, switches
+        the modularity function used. If recalculate=True, also recalculates
+        the modularities and optimal count.
+
+        Note: currently useless, as there is only one available measure.
+        """
+        if measure in self._measureDict:
+            self._modularity_measure = measure
         else: raise KeyError("Modularity measure not found.")
+        if recalculate:
+            self.recalculate_modularities()
+
+
+    def recalculate_modularities(self):
+        """
+        Recalculates the modularities and optimal count using the modularity_measure.
+        """
+        measure = self._measureDict[self._modularity_measure](self._graph)
+        self._modularities = {k : measure(self[k]) for k in self._counts()}
+        self._optimal_count = max(iter(self._modularities.items()), key=operator.itemgetter(1))[0]
+        return self._modularities
+
+
+    @property
+    def modularities(self):
+        """
+        Returns the a dict {c : m} where c is the number of clusters
+        in the cover and m is the modularity. If modularity has not
+        been calculated, it recalculates it for all covers. Otherwise,
+        it returns the stored dict.
+
+        Note: Call recalculate_modularities to recalculate the modularity.
+        """
+        if self._modularities:
+            return self._modularities
+        self._modularities = self.recalculate_modularities()
+        return self._modularities
+
+
+    @property
+    def optimal_count(self):
+        """Returns the optimal number of clusters for this list of covers.
+
+        If an optimal count hint was given at construction time and
+        recalculate_modularities has not been called, this property simply returns the
+        hint. Otherwise it maximizes the modularity along all covers in the object.
+
+        Note: Call recalculate_modularities to recalculate the optimal count.
+        """
+        if self._optimal_count is not None:
+            return self._optimal_count
+        modularities = self.modularities
+        self._optimal_count = max(list(modularities.items()), key=operator.itemgetter(1))[0]
+        return self._optimal_count
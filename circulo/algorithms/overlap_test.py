@@ -0,0 +1,158 @@
+import circulo.algorithms.overlap as overlap
+import circulo.algorithms.conga as CONGA
+import unittest
+import random
+import igraph
+import numpy as np
+from collections import Counter
+
+
+class TestOverlapFunctions(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Initializes the graph for testing to Zachary's
+        karate club.
+        """
+        self.graph = igraph.Graph.Famous("zachary")
+
+
+    def tearDown(self):
+        self.graph = None
+
+
+    def test_lazar_modularity(self):
+        """
+        Checks that the sparse Lazar modularity matches the sum of the
+        modularities of single communities, weighted or not.
+        """
+        covers = [[list(range(34))],
+                  [list(range(17)), list(range(15, 34))],
+                  [[0, 1, 2, 3, 7, 13], [0, 4, 5, 6, 10, 16], [2, 8, 30, 32, 33], list(range(14, 34)), [11]]]
+        for weighted in (False, True):
+            if weighted:
+                self.graph.es['weight'] = [1 + (e.index % 5) / 2. for e in self.graph.es]
+            weights = overlap.get_weights(self.graph)
+            measure = overlap.LazarModularity(self.graph)
+            for cover in covers:
+                counts = overlap.count_communities(self.graph, cover)
+                expected = sum(overlap.get_single_lazar_modularity(self.graph, c, weights, counts)
+                               for c in cover) / len(cover)
+                self.assertAlmostEqual(measure(cover), expected)
+                self.assertAlmostEqual(overlap.lazar_modularity(self.graph, cover), expected)
+        # a vertex listed twice, like the two copies of a split vertex, counts once.
+        self.assertAlmostEqual(measure([[0, 1, 2, 2], [2, 3]]), measure([[0, 1, 2], [2, 3]]))
+
+
+    def test_modularity_sweep(self):
+        """
+        Checks that scoring consecutive covers incrementally gives the
+        same modularities as scoring each from scratch.
+        """
+        result = CONGA.conga(self.graph)
+        measure = overlap.LazarModularity(self.graph)
+        counts = list(result._counts())
+        swept = list(measure.sweep(*result._covers.walk_back(counts[-1], counts[0])))
+        self.assertEqual(len(swept), len(counts))
+        for modularity, k in zip(swept, reversed(counts)):
+            self.assertAlmostEqual(modularity, measure(result[k]))
+        full = dict(result.recalculate_modularities(incremental=False))
+        for k, modularity in result.recalculate_modularities().items():
+            self.assertAlmostEqual(modularity, full[k])
+        for incremental in (True, False):
+            pooled = result.recalculate_modularities(incremental=incremental, workers=2)
+            self.assertEqual(sorted(pooled), sorted(full))
+            for k, modularity in pooled.items():
+                self.assertAlmostEqual(modularity, full[k])
+
+
+    def test_sweep_steps(self):
+        """
+        Checks that each step of a sweep adds to the larger of the two merged
+        communities only the members of the smaller that it lacks, and recounts
+        only the vertices that were in both.
+        """
+        random.seed(41)
+        for G in (self.graph, igraph.Graph.Erdos_Renyi(80, m=200)):
+            result = CONGA.conga(G)
+            counts = list(result._counts())
+            clusters, merges = result._covers.walk_back(counts[-1], counts[0])
+            joined, recounted = [], []
+            join, recount = overlap._LazarState._join, overlap._LazarState._recount
+            def record_join(state, c, u):
+                joined[-1].append(u)
+                return join(state, c, u)
+            def record_recount(state, v):
+                recounted[-1].append(v)
+                return recount(state, v)
+            def steps():
+                for step in merges:
+                    joined.append([])
+                    recounted.append([])
+                    yield step
+            overlap._LazarState._join, overlap._LazarState._recount = record_join, record_recount
+            try:
+                list(overlap.LazarModularity(G).sweep(clusters, steps()))
+            finally:
+                overlap._LazarState._join, overlap._LazarState._recount = join, recount
+
+            self.assertEqual(len(joined), len(counts) - 1)
+            for k, added, dropped in zip(reversed(counts[:-1]), joined, recounted):
+                before = Counter(frozenset(c) for c in result[k + 1])
+                after = Counter(frozenset(c) for c in result[k])
+                x, y = (before - after).elements()
+                self.assertEqual(list((after - before).elements()), [x | y])
+                self.assertEqual(sorted(dropped), sorted(x & y))
+                self.assertLessEqual(len(added), min(len(x), len(y)))
+                self.assertIn(set(added), (x - y, y - x))
+                self.assertEqual(len(added), len(set(added)))
+
+
+    def test_nepusz_modularity(self):
+        """
+        Checks the Nepusz modularity against its double sum, dense and sparse,
+        and that it is Newman's modularity on a partition.
+        """
+        partition = self.graph.community_multilevel()
+        membership = overlap.fuzzy_membership(self.graph, list(partition))
+        self.assertAlmostEqual(overlap.nepusz_modularity(self.graph, membership), partition.modularity)
+
+        cover = [[0, 1, 2, 3, 7, 8], [2, 8, 9, 30, 31, 32, 33], [0, 4, 5, 6, 10, 16]]
+        membership = overlap.fuzzy_membership(self.graph, cover)
+        self.assertAlmostEqual(membership[2].sum(), 1)
+        self.assertAlmostEqual(membership[2, 0], .5)
+        adjacency = np.array(self.graph.get_adjacency().data, dtype=float)
+        degrees = adjacency.sum(axis=1)
+        similarity = membership.dot(membership.T).toarray()
+        expected = ((adjacency - np.outer(degrees, degrees) / degrees.sum()) * similarity).sum() / degrees.sum()
+        self.assertAlmostEqual(overlap.nepusz_modularity(self.graph, membership), expected)
+        self.assertAlmostEqual(overlap.nepusz_modularity(self.graph, membership.toarray()), expected)
+
+        fuzzy = overlap.CrispOverlap(self.graph, {1 : [list(range(34))], 3 : cover}).make_fuzzy()
+        self.assertEqual(len(fuzzy), 2)
+        self.assertAlmostEqual(fuzzy.modularities[1], 0)
+        self.assertAlmostEqual(fuzzy.modularities[3], expected)
+        self.assertEqual(fuzzy.optimal_count, 3)
+        self.assertEqual([sorted(c) for c in fuzzy.as_cover()], [sorted(c) for c in cover])
+        self.assertEqual(list(fuzzy.threshold(3, .5)[0]), [1, 3, 7])
+
+
+    def test_sweep_optimal_count(self):
+        """
+        Checks that the optimal count after an incremental sweep is the one
+        found by scoring every cover from scratch, with its modularity
+        scored from scratch too, serially and by a pool.
+        """
+        random.seed(41)
+        for G in (self.graph, igraph.Graph.Erdos_Renyi(80, m=200)):
+            result = CONGA.conga(G)
+            full = result.recalculate_modularities(incremental=False)
+            optimal = max(full.items(), key=lambda item: item[1])[0]
+            for workers in (None, 2):
+                swept = result.recalculate_modularities(workers=workers)
+                self.assertEqual(result.optimal_count, optimal)
+                self.assertEqual(swept[optimal], full[optimal])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import heapq
+
+
+class MaxQueue(object):
+	"""
+	A max-priority queue of keys whose scores can go up or down, as edge
+	betweennesses do while a divisive algorithm runs.
+
+	The current score of every key is held in a dict, and the heap may also
+	hold stale entries left by earlier scores or by removed keys. Those are
+	skipped, and dropped, when they reach the top, so changing or removing a
+	key costs O(log m) and finding the maximum O(log m) amortized. Keys must
+	be orderable; among keys with the same score the smallest comes first.
+	"""
+	def __init__(self, items=()):
+		"""
+		Starts a queue holding the (key, score) pairs in items.
+		"""
+		self._scores = dict(items)
+		self._heap = [(-score, key) for key, score in self._scores.items()]
+		heapq.heapify(self._heap)
+
+
+	def __len__(self):
+		return len(self._scores)
+
+
+	def __contains__(self, key):
+		return key in self._scores
+
+
+	def update(self, key, score):
+		"""
+		Adds key to the queue with the given score, or changes its score.
+		"""
+		if self._scores.get(key) == score:
+			return
+		self._scores[key] = score
+		heapq.heappush(self._heap, (-score, key))
+		# keep stale entries from outnumbering the live ones.
+		if len(self._heap) > 2 * len(self._scores) + 64:
+			self._heap = [(-s, k) for k, s in self._scores.items()]
+			heapq.heapify(self._heap)
+
+
+	def remove(self, key):
+		"""
+		Takes key out of the queue. Its heap entries go stale.
+		"""
+		self._scores.pop(key, None)
+
+
+	def peek(self):
+		"""
+		Returns the key with the maximum score, along with that score, while
+		leaving it in the queue. Raises IndexError if the queue is empty.
+		"""
+		heap = self._heap
+		while heap:
+			score, key = heap[0]
+			if self._scores.get(key) == -score:
+				return key, -score
+			heapq.heappop(heap)
+		raise IndexError("peek from an empty MaxQueue")
+
+
+	def pop(self):
+		"""
+		Removes and returns the key with the maximum score, along with that
+		score.
+		"""
+		key, score = self.peek()
+		heapq.heappop(self._heap)
+		del self._scores[key]
+		return key, score
+
+
+class BucketQueue(object):
+	"""
+	A min-priority queue of keys whose scores can go up or down, in which
+	keys with the same score share a bucket and the whole bucket with the
+	minimum score can be taken out at once, as Radicchi removes every edge
+	tied for the lowest clustering coefficient together.
+
+	Buckets are kept in a dict by score, and a heap holds the scores of the
+	buckets. A bucket that empties is dropped from the dict, and its score
+	is skipped when it reaches the top of the heap.
+	"""
+	def __init__(self, items=()):
+		"""
+		Starts a queue holding the (key, score) pairs in items.
+		"""
+		self._scores = {}
+		self._buckets = {}
+		self._heap = []
+		for key, score in items:
+			self.update(key, score)
+
+
+	def __len__(self):
+		return len(self._scores)
+
+
+	def __contains__(self, key):
+		return key in self._scores
+
+
+	def update(self, key, score):
+		"""
+		Adds key to the queue with the given score, or changes its score.
+		"""
+		if self._scores.get(key) == score:
+			return
+		self.remove(key)
+		self._scores[key] = score
+		bucket = self._buckets.get(score)
+		if bucket is None:
+			bucket = self._buckets[score] = set()
+			heapq.heappush(self._heap, score)
+		bucket.add(key)
+
+
+	def remove(self, key):
+		"""
+		Takes key out of the queue, if it is there.
+		"""
+		if key not in self._scores:
+			return
+		score = self._scores.pop(key)
+		bucket = self._buckets[score]
+		bucket.discard(key)
+		if not bucket:
+			del self._buckets[score]
+
+
+	def pop_min(self):
+		"""
+		Removes and returns the minimum score along with the list of all keys
+		that have it. Raises IndexError if the queue is empty.
+		"""
+		heap = self._heap
+		while heap:
+			score = heapq.heappop(heap)
+			bucket = self._buckets.pop(score, None)
+			if bucket:
+				for key in bucket:
+					del self._scores[key]
+				return score, list(bucket)
+		raise IndexError("pop from an empty BucketQueue")
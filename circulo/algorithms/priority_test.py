@@ -0,0 +1,45 @@
+import circulo.algorithms.priority as priority
+import unittest
+import numpy as np
+
+
+class TestPriorityFunctions(unittest.TestCase):
+
+    def test_max_queue(self):
+        """
+        Checks that the queue of edge betweennesses always yields the first
+        edge with the maximum score, as scores change and edges go.
+        """
+        rng = np.random.RandomState(0)
+        scores = dict(enumerate(rng.randint(0, 10, 50).astype(float)))
+        queue = priority.MaxQueue(scores.items())
+        while scores:
+            best = max(scores.values())
+            self.assertEqual(queue.peek(), (min(k for k, s in scores.items() if s == best), best))
+            for key in rng.choice(list(scores), 3):
+                scores[key] += rng.randint(-3, 4)
+                queue.update(key, scores[key])
+            key = rng.choice(list(scores))
+            del scores[key]
+            queue.remove(key)
+        self.assertEqual(len(queue), 0)
+        self.assertRaises(IndexError, queue.peek)
+
+
+    def test_bucket_queue(self):
+        """
+        Checks that the bucket queue gives up all keys tied for the minimum.
+        """
+        queue = priority.BucketQueue([('a', 2.), ('b', 1.), ('c', 1.), ('d', float('inf'))])
+        queue.update('c', 3.)
+        queue.update('a', 1.)
+        score, keys = queue.pop_min()
+        self.assertEqual((score, sorted(keys)), (1., ['a', 'b']))
+        queue.remove('c')
+        self.assertEqual(queue.pop_min(), (float('inf'), ['d']))
+        self.assertEqual(len(queue), 0)
+        self.assertRaises(IndexError, queue.pop_min)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,20 +2,43 @@ import sys
 import igraph as ig
 import itertools
 import argparse
+import functools
+import multiprocessing
+import numpy as np
+import scipy.sparse
 
-def radicchi(G, measure='weak'):
+from circulo.algorithms.checkpoint import checkpointer, run_key
+from circulo.algorithms.priority import BucketQueue
+from circulo.algorithms.betweenness import expand_ranges
+from circulo.algorithms.connectivity import Components
+
+# Roughly how many vertices and edges igraph can find the components of in the time
+# a search out from the ends of one removed edge takes.
+LOCAL_SEARCH_COST = 1000
+
+def radicchi(G, measure='weak', checkpoint=None, checkpoint_interval=600, workers=None):
     """ Wrapper for execution of the Radicchi community-detection algorithm. Returns 
     covers of the graph, with metadata representing provenance - in essence, a "dendrogram"
-    that represents splits into communities. """
+    that represents splits into communities.
+
+    If checkpoint is a path, the progress of the run is saved there every checkpoint_interval
+    seconds, and a run on the same graph with the same measure resumes from the last save.
+    The file is deleted when the run finishes.
+
+    If workers is greater than 1, the subgraphs left by each split are split further by that
+    many processes. """
     g = G.copy()
     g.vs['id'] = list(range(g.vcount()))
 
+    cp = checkpointer(checkpoint, run_key('radicchi', G, measure), checkpoint_interval)
     if measure=='weak':
-        result = radicchi_internal(G, g, 0, measure=measure, clustering=4)
+        result = radicchi_internal(G, g, 0, measure=measure, clustering=4, checkpoint=cp, workers=workers)
     elif measure=='strong':
-        result = radicchi_internal(G, g, 0, measure=measure, clustering=3)
+        result = radicchi_internal(G, g, 0, measure=measure, clustering=3, checkpoint=cp, workers=workers)
     else:
         raise Exception('Other measures of community not yet supported')
+    if cp is not None:
+        cp.remove()
 
     clustering = [0] * G.vcount()
     for i,l in enumerate(result):
@@ -24,10 +47,97 @@ def radicchi(G, measure='weak'):
 
     return ig.VertexClustering(G, clustering)
 
-def radicchi_internal(G, g, level, measure='strong', clustering=3):
+def radicchi_internal(G, g, level, measure='strong', clustering=3, checkpoint=None, workers=None):
     """
     Uses the Radicchi et al. algorithm to find the communities in a graph. Returns a list of the splits in the graph.
+
+    Each split of g (see split_until_pruned) leaves subgraphs that are split in turn, independently
+    of each other. Rather than recursing, the subgraphs go on a work queue that is worked off a wave
+    at a time, by a pool of worker processes if workers is greater than 1. Once the queue is empty,
+    the communities are put together from the deepest splits up. level is the depth of g in the splits.
+
+    If a Checkpoint is given, g is saved to it as edges are removed, and after the first split the
+    queue is, every so often. A saved run is resumed from where it left off.
+    """
+    state = checkpoint.load() if checkpoint is not None else None
+    if state is not None and state[0] == 'queue':
+        _, tasks, frontier = state
+    else:
+        if state is not None:
+            g = state[1]
+        tasks = [{'level': level, 'parent': None}]
+        tasks[0]['split'] = split_until_pruned(G, g, measure, clustering, checkpoint)
+        frontier = enqueue(tasks, [0])
+
+    pool = None
+    if workers is not None and workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=_init_split, initargs=(G, measure))
+    try:
+        while frontier:
+            graphs = [tasks[i].pop('graph') for i in frontier]
+            if pool is not None:
+                splits = pool.map(_split_run, graphs, chunksize=1)
+            else:
+                splits = [split_until_pruned(G, s, measure) for s in graphs]
+            for i, split in zip(frontier, splits):
+                tasks[i]['split'] = split
+            frontier = enqueue(tasks, frontier)
+            if checkpoint is not None and checkpoint.due():
+                checkpoint.save(('queue', tasks, frontier))
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    # children always come after their parents.
+    for task in reversed(tasks):
+        split = task['split']
+        communities = []
+        if split is not None:
+            for i, child in enumerate(split['children']):
+                subcommunities = tasks[child]['communities']
+                if len(subcommunities) == 0:
+                    communities.append(split['orig_communities'][i])
+                else:
+                    communities.extend(subcommunities)
+
+            clustered = {i for c in tasks[split['rest']]['communities'] for i in c}
+            isolated_remaining = [i for i in split['orig_remaining'] if i not in clustered]
+            communities.extend([[i] for i in isolated_remaining])
+        task['communities'] = communities
+
+    return tasks[0]['communities']
+
+def enqueue(tasks, done):
     """
+    Given the indices of tasks just split, adds a task for every subgraph each split left,
+    the communities and then the rest, and returns the indices of the new tasks.
+    """
+    frontier = []
+    for i in done:
+        split = tasks[i]['split']
+        if split is None:
+            continue
+        split['children'] = []
+        for s in split.pop('subgraphs'):
+            split['children'].append(len(tasks))
+            frontier.append(len(tasks))
+            tasks.append({'level': tasks[i]['level'] + 1, 'parent': i, 'graph': s})
+        split['rest'] = len(tasks)
+        frontier.append(len(tasks))
+        tasks.append({'level': tasks[i]['level'] + 1, 'parent': i, 'graph': split.pop('remaining')})
+    return frontier
+
+def split_until_pruned(G, g, measure='strong', clustering=3, checkpoint=None):
+    """
+    Removes the edges of g with the lowest edge clustering coefficient until g falls apart into
+    at least two components that are communities of G, by the given measure. Returns None if that
+    never happens, and otherwise a dict of the communities as vertex ids of G (orig_communities),
+    the subgraphs of g they induce (subgraphs), the ids of the vertices in no community
+    (orig_remaining) and the subgraph those induce (remaining).
+    If a Checkpoint is given, g is saved to it as edges are removed.
+    """
+
     # Caching some global graph information and updating it manually. Because igraph
     # tends to recalculate this stuff on the whole graph every time, 
     # storing it and manipulating only the parts that change will make things faster.
@@ -35,70 +145,122 @@ def radicchi_internal(G, g, level, measure='strong', clustering=3):
     degree = g.degree()
     neighbors = [set(g.neighbors(v)) for v in g.vs]
     edges = {e.tuple for e in g.es}
-    n_components = len(g.components())
 
+    # Components are found once, and after each removal only a search out
+    # from the two ends of the removed edge tells whether it split one. When
+    # a great many edges are tied for removal, finding the components anew
+    # is cheaper.
+    components = Components(g)
+    n_components = len(components)
+
+    # With the components tracked, g itself is only needed when it is split
+    # or saved, so removed edges wait here to be deleted from it in one go.
+    removed = []
+
+    squares = None
     if clustering == 3:
         edge_clustering_coefficient = edge_clustering_coefficient_3 
     else:
-        edge_clustering_coefficient = edge_clustering_coefficient_4
+        # squares are counted for every edge at once, then corrected as edges go.
+        squares = square_counts(g)
+        edge_clustering_coefficient = functools.partial(edge_clustering_coefficient_4, squares=squares)
+
+    # The coefficients are kept in buckets by value, so that all the edges
+    # tied for the minimum come out together, and after a deletion only the
+    # edges whose coefficients it could change are recomputed.
+    queue = BucketQueue((e, edge_clustering_coefficient(e[0], e[1], degree, neighbors)) for e in edges)
 
-    communities = []
     while True:
         if len(edges) == 0:
-            break
-
-        min_edges = []; min_ecc = None
-        for e in edges:
-            ecc = edge_clustering_coefficient(e[0], e[1], degree, neighbors)
-            if not min_ecc or ecc < min_ecc:
-                min_edges = [e]
-                min_ecc = ecc
-            elif ecc == min_ecc:
-                min_edges.append(e)
-
-        g.delete_edges(min_edges); 
+            return None
+
+        _, min_edges = queue.pop_min()
+
+        removed.extend(min_edges)
+        local = len(min_edges) * LOCAL_SEARCH_COST <= g.vcount() + len(edges)
         for min_edge in min_edges:
             edges.discard(min_edge)
             u, v = min_edge
             neighbors[u].discard(v); neighbors[v].discard(u)
             degree[u] -= 1; degree[v] -= 1
+            if squares is not None:
+                remove_squares(squares, u, v, neighbors)
+            if local:
+                components.separated(neighbors, u, v)
+        if not local:
+            g.delete_edges(removed); removed = []
+            components.refresh(g)
 
-        n_components_new = len(g.components())
+        for e in affected_edges(min_edges, neighbors, clustering):
+            queue.update(e, edge_clustering_coefficient(e[0], e[1], degree, neighbors))
+
+        n_components_new = len(components)
 
         if n_components_new > n_components:
-            result = prune_components(G, g, community_measure=measure)
+            g.delete_edges(removed); removed = []
+            result = prune_components(G, g, community_measure=measure, membership=components.membership)
             n_components = n_components_new
             if result['pruned']:
-                orig_communities = result['orig_communities']
-                new_communities = result['new_communities']
                 remaining = result['remaining']
+                return {"orig_communities": result['orig_communities'],
+                        "subgraphs": [g.subgraph(c) for c in result['new_communities']],
+                        "orig_remaining": [g.vs[i]['id'] for i in remaining],
+                        "remaining": g.subgraph(remaining)}
 
-                for i,c in enumerate(new_communities):
-                    s = g.subgraph(c)
-                    subcommunities = radicchi_internal(G, s, level+1, measure)
-                    if len(subcommunities) == 0:
-                        communities.append(orig_communities[i])
-                    else:
-                        communities.extend(subcommunities)
+        if checkpoint is not None and checkpoint.due():
+            g.delete_edges(removed); removed = []
+            checkpoint.save(('split', g))
 
-                orig_remaining = [g.vs[i]['id'] for i in remaining]
-                r = g.subgraph(remaining)
-                subcommunities = radicchi_internal(G, r, level+1, measure)
-                clustered = sum(subcommunities, [])
-                isolated_remaining = [i for i in orig_remaining if i not in clustered]
-                communities.extend([[i] for i in isolated_remaining])
+# The original graph and community measure of a parallel radicchi_internal,
+# set once in each worker process.
+_split = {}
 
-                break
+def _init_split(G, measure):
+    """
+    Pool initializer for radicchi_internal.
+    """
+    _split['graph'] = G
+    _split['measure'] = measure
 
-    return communities
+def _split_run(g):
+    """
+    Splits the subgraph g in a worker process. See split_until_pruned.
+    """
+    return split_until_pruned(_split['graph'], g, _split['measure'])
 
-def prune_components(orig, new, community_measure='strong'):
+def affected_edges(deleted, neighbors, clustering=3):
+    """
+    Given edges just deleted and the neighbor sets left after the deletion,
+    returns the set of remaining edges whose edge clustering coefficient
+    can have changed: those that share an endpoint with a deleted edge, whose
+    degree dropped, and for clustering=4 those on the opposite side of a
+    square through a deleted edge. A triangle through a deleted edge only
+    holds edges that share an endpoint with it.
+    """
+    affected = set()
+    for u, v in deleted:
+        for a in (u, v):
+            affected.update((a, w) if a < w else (w, a) for w in neighbors[a])
+        if clustering == 4:
+            # squares u - v - x - y - u
+            for x in neighbors[v]:
+                affected.update((x, y) if x < y else (y, x) for y in neighbors[x] & neighbors[u])
+    return affected
+
+def prune_components(orig, new, community_measure='strong', membership=None):
     """ Uses the given community measure to prune connected components in the graph new that
-        represent communities in the graph orig, using the given community measure.  """
-    components = new.components()
+        represent communities in the graph orig, using the given community measure. If the
+        component membership of the vertices of new is given, it is used instead of finding
+        the components again. """
+    if membership is None:
+        membership = new.components().membership
     ids = new.vs['id']
 
-    new_components = [c for c in components]
+    # in the order igraph lists them: by smallest vertex, each in increasing order.
+    groups = {}
+    for v, c in enumerate(membership):
+        groups.setdefault(c, []).append(v)
+    new_components = list(groups.values())
     orig_components = [[ids[v] for v in component] for component in new_components]
 
     is_community = is_strong_community if (community_measure=='strong') else is_weak_community
@@ -166,15 +328,19 @@ def edge_clustering_coefficient_3(u, v, degree, neighbors):
         cdeg = len(neighbors[u] & neighbors[v])
         return (cdeg + 1.0) / mdeg
 
-def edge_clustering_coefficient_4(u, v, degree, neighbors):
+def edge_clustering_coefficient_4(u, v, degree, neighbors, squares=None):
     """
     Computes a modified form of the edge clustering coefficient using squares instead of triangles.
+    If squares, a dict of the number of squares each edge (u, v) with u < v is in, is given, the
+    squares are looked up there instead of counted.
     """
     udeg = degree[u]
     vdeg = degree[v]
     mdeg = (udeg-1)*(vdeg-1)
     if mdeg == 0:
         return float('inf')
+    elif squares is not None:
+        return (squares[(u, v) if u < v else (v, u)] + 1.0) / mdeg
     else:
         uneighbors = neighbors[u] - {v}
         vneighbors = neighbors[v] - {u} 
@@ -186,10 +352,52 @@ def edge_clustering_coefficient_4(u, v, degree, neighbors):
         
         return (num_squares + 1.0) / mdeg
 
+def square_counts(g):
+    """
+    Returns a dict of the number of squares each edge (u, v), u < v, of the simple graph g is in,
+    for all edges at once. With A the adjacency matrix, (A^3)[u, v] counts the walks u - w - z - v,
+    and of those to a neighbor v of u, all but deg(u) + deg(v) - 1 go around a square. A^3 is only
+    needed at the edges, so it is summed over the neighbors w of the lower degree endpoint u
+    from the entries (w, v) of the sparse product A^2.
+    """
+    n = g.vcount()
+    edges = np.array(g.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    m = len(edges)
+    if not m:
+        return {}
+    adjacency = scipy.sparse.csr_matrix(
+            (np.ones(2 * m), (np.concatenate((edges[:, 0], edges[:, 1])), np.concatenate((edges[:, 1], edges[:, 0])))),
+            shape=(n, n))
+    degree = np.diff(adjacency.indptr)
+    paths = adjacency.dot(adjacency).tocsr()
+
+    low = degree[edges[:, 0]] <= degree[edges[:, 1]]
+    u = np.where(low, edges[:, 0], edges[:, 1])
+    v = np.where(low, edges[:, 1], edges[:, 0])
+    counts = degree[u]
+    w = adjacency.indices[expand_ranges(adjacency.indptr[u], counts)]
+    owner = np.repeat(np.arange(m), counts)
+    walks = np.bincount(owner, weights=np.asarray(paths[w, v[owner]]).ravel(), minlength=m)
+    squares = np.rint(walks - degree[u] - degree[v] + 1).astype(np.int64)
+    return dict(zip(map(tuple, edges.tolist()), squares.tolist()))
+
+def remove_squares(squares, u, v, neighbors):
+    """
+    Corrects the square counts for the deletion of the edge (u, v), which must already be gone
+    from the neighbor sets: every other edge of a square u - v - x - y - u loses that square.
+    """
+    squares.pop((u, v) if u < v else (v, u), None)
+    for x in neighbors[v]:
+        for y in neighbors[x] & neighbors[u]:
+            for a, b in ((v, x), (x, y), (y, u)):
+                squares[(a, b) if a < b else (b, a)] -= 1
+
 def main():
     parser = argparse.ArgumentParser(description="""Run the Radicchi algorithm from the command line.""")
     parser.add_argument('-s', '--strength', choices=['strong', 'weak'], 
                         help="""Use strong or weak definition of community structure in the graph.""")
+    parser.add_argument('-c', '--checkpoint', help="""Save progress to this file now and then, and resume from it if it exists.""")
+    parser.add_argument('-w', '--workers', type=int, help="""Number of processes that split the subgraphs left by each split.""")
     parser.add_argument('file', nargs='?', help="""The path to the file in the GML file format.""")
     args = parser.parse_args()
 
@@ -199,7 +407,7 @@ def main():
         return
 
     g = ig.Graph.Read_GML(args.file).as_undirected()
-    communities = radicchi(g, measure=args.strength)
+    communities = radicchi(g, measure=args.strength, checkpoint=args.checkpoint, workers=args.workers)
 
     print(communities)
 
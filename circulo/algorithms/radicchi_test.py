@@ -0,0 +1,136 @@
+import circulo.algorithms.radicchi as radicchi
+import unittest
+import os
+import tempfile
+import igraph
+
+
+def ring_of_cliques(count, size):
+    """
+    Returns count cliques of the given size, each joined to the next
+    around a ring by a single edge.
+    """
+    G = igraph.Graph()
+    for i in range(count):
+        G = G + igraph.Graph.Full(size)
+    G.add_edges([(i * size, ((i + 1) % count) * size) for i in range(count)])
+    return G
+
+
+def nested_rings():
+    """
+    Returns three rings of cliques joined in a ring, so that Radicchi's
+    splits go three levels deep.
+    """
+    G = igraph.Graph()
+    for i in range(3):
+        G = G + ring_of_cliques(4, 5)
+    G.add_edges([(i * 20, ((i + 1) % 3) * 20 + 1) for i in range(3)])
+    return G
+
+
+class TestRadicchiFunctions(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Initializes the graphs for testing to Zachary's karate club,
+        nested rings of cliques and a disconnected graph.
+        """
+        self.graph = igraph.Graph.Famous("zachary")
+        self.graphs = [self.graph, nested_rings(),
+                       self.graph + igraph.Graph.Famous("Krackhardt_Kite") + igraph.Graph(3)]
+
+
+    def tearDown(self):
+        self.graph = None
+        self.graphs = None
+
+
+    def test_workers(self):
+        """
+        Checks that splitting the queued subgraphs in a pool of worker
+        processes finds the same communities as splitting them in turn.
+        """
+        for G in self.graphs:
+            for measure in ('strong', 'weak'):
+                expected = radicchi.radicchi(G, measure=measure)
+                result = radicchi.radicchi(G, measure=measure, workers=2)
+                self.assertEqual(result.membership, expected.membership)
+
+
+    def test_split_checkpoint(self):
+        """
+        Checks that a run killed part way through removing edges resumes
+        from the saved graph and finds the same communities as an
+        uninterrupted run.
+        """
+        for measure in ('strong', 'weak'):
+            expected = radicchi.radicchi(self.graph, measure=measure)
+            path = os.path.join(tempfile.mkdtemp(), 'radicchi.ckpt')
+            affected, calls = radicchi.affected_edges, []
+            def crash(*args):
+                calls.append(args)
+                if len(calls) == 8:
+                    raise KeyboardInterrupt
+                return affected(*args)
+            radicchi.affected_edges = crash
+            try:
+                self.assertRaises(KeyboardInterrupt, radicchi.radicchi, self.graph, measure=measure,
+                                  checkpoint=path, checkpoint_interval=0)
+            finally:
+                radicchi.affected_edges = affected
+            self.assertTrue(os.path.exists(path))
+            result = radicchi.radicchi(self.graph, measure=measure, checkpoint=path)
+            self.assertFalse(os.path.exists(path))
+            self.assertEqual(result.membership, expected.membership)
+
+
+    def test_queue_checkpoint(self):
+        """
+        Checks that a run killed between waves of the work queue resumes
+        from the saved queue and finds the same communities as an
+        uninterrupted run, with and without workers.
+        """
+        G = nested_rings()
+        for measure in ('strong', 'weak'):
+            expected = radicchi.radicchi(G, measure=measure)
+            for workers in (None, 2):
+                path = os.path.join(tempfile.mkdtemp(), 'radicchi.ckpt')
+                enqueue, calls = radicchi.enqueue, []
+                def crash(*args):
+                    calls.append(args)
+                    if len(calls) == 3:
+                        raise KeyboardInterrupt
+                    return enqueue(*args)
+                radicchi.enqueue = crash
+                try:
+                    self.assertRaises(KeyboardInterrupt, radicchi.radicchi, G, measure=measure,
+                                      checkpoint=path, checkpoint_interval=0, workers=workers)
+                finally:
+                    radicchi.enqueue = enqueue
+                self.assertTrue(os.path.exists(path))
+                result = radicchi.radicchi(G, measure=measure, checkpoint=path, workers=workers)
+                self.assertFalse(os.path.exists(path))
+                self.assertEqual(result.membership, expected.membership)
+
+
+    def test_square_counts(self):
+        """
+        Checks the bulk square counts against counting each edge's squares,
+        and their correction as edges are deleted.
+        """
+        neighbors = [set(self.graph.neighbors(v)) for v in self.graph.vs]
+        degree = self.graph.degree()
+        squares = radicchi.square_counts(self.graph)
+        for u, v in self.graph.get_edgelist():
+            self.assertEqual(radicchi.edge_clustering_coefficient_4(u, v, degree, neighbors, squares),
+                             radicchi.edge_clustering_coefficient_4(u, v, degree, neighbors))
+        for u, v in self.graph.get_edgelist()[::3]:
+            neighbors[u].discard(v); neighbors[v].discard(u)
+            radicchi.remove_squares(squares, u, v, neighbors)
+        self.graph.delete_edges(self.graph.get_edgelist()[::3])
+        self.assertEqual(squares, radicchi.square_counts(self.graph))
+
+
+if __name__ == '__main__':
+    unittest.main()